@@ -1,7 +1,41 @@
-from collections import UserDict
-from datetime import datetime, date
+from bisect import bisect_left
+from calendar import isleap
+from collections import UserDict, defaultdict
+from datetime import datetime, date, timedelta
+from itertools import count
 import json
 import re
+import sys
+
+from assistant_ostap.assistant_ostap.files import atomic_write
+from assistant_ostap.assistant_ostap.paging import PageView
+
+
+# Шаблони компілюються один раз, а не при кожній перевірці.
+# Номер: необов'язково +, потім цифра від 1 до 9 та 11 цифр від 0 до 9
+PHONE_PATTERN = re.compile(r"^\+?[1-9][\d]{11}$")
+EMAIL_PATTERN = re.compile(r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$")
+DAYS_IN_MONTH = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+
+def parse_date(value: str):
+    """Return (day, month, year) of the date in format DD.MM.YYYY or None."""
+    if not value:
+        return None
+    # Звичайний запис DD.MM.YYYY розбирається вручну, бо strptime повільний
+    if len(value) == 10 and value.isascii() and value[2] == "." and value[5] == "." \
+            and value[:2].isdecimal() and value[3:5].isdecimal() and value[6:].isdecimal():
+        day, month, year = int(value[:2]), int(value[3:5]), int(value[6:])
+        if not (1 <= month <= 12 and year >= 1):
+            return None
+        last_day = 29 if month == 2 and isleap(year) else DAYS_IN_MONTH[month - 1]
+        return (day, month, year) if 1 <= day <= last_day else None
+    # Рідші записи на зразок 1.2.1990 strptime теж приймає
+    try:
+        parsed = datetime.strptime(value, "%d.%m.%Y")
+    except ValueError:
+        return None
+    return parsed.day, parsed.month, parsed.year
 
 
 class WrongPhone(Exception):
@@ -25,6 +59,10 @@ class NoName(Exception):
 
 
 class Field:
+    # __slots__ замість __dict__ у кожного екземпляра суттєво зменшують
+    # пам'ять, яку займає велика книга контактів
+    __slots__ = ("_value",)
+
     def __init__(self, value):
         self._value = value
 
@@ -46,6 +84,8 @@ class Field:
 
 
 class Name(Field):
+    __slots__ = ()
+
     @staticmethod
     def is_valid_name(name):
         if name.strip() == '':
@@ -67,16 +107,14 @@ class Name(Field):
 
 
 class Phone(Field):
+    __slots__ = ()
 
     @staticmethod
     def is_valid_phone(phone):
         if phone == '':
             return True
-        # Валідація номеру телефону відбувається за
-        # допомогою регулярнго виразу, що означає: необов'язково +, потім цифра від 1 до 9
-        # та 11 цифр від 0 до 9. Тобто валідними будуть такі номери +123456987456 та 123456987456,
-        match = re.search(r"^\+?[1-9][\d]{11}$", phone)
-        return bool(match)
+        # Валідними будуть такі номери +123456987456 та 123456987456 (див. PHONE_PATTERN)
+        return bool(PHONE_PATTERN.search(phone))
 
     @property
     def value(self):
@@ -92,18 +130,26 @@ class Phone(Field):
 
 
 class Birthday(Field):
+    __slots__ = ("month_day",)
+
+    def __init__(self, value):
+        super().__init__(value)
+        # Місяць та день народження розбираються один раз, а не при кожному
+        # підрахунку днів до дня народження
+        self.month_day = self.parse_month_day(value)
+
+    @staticmethod
+    def parse_month_day(value):
+        parsed = parse_date(str(value))
+        if parsed is None:
+            return None
+        return parsed[1], parsed[0]
 
     @staticmethod
     def is_valid_date(date):
-        # Валідація дня народження є значно простішою, ніж номеру телефону.
-        # Якщо ввід користувача перетворюється у об'єкт datetime то дата валідна
-        try:
-            if date == '':
-                return True
-            datetime.strptime(str(date), "%d.%m.%Y")
+        if date == '':
             return True
-        except ValueError:
-            return False
+        return parse_date(str(date)) is not None
 
     @property
     def value(self):
@@ -113,18 +159,42 @@ class Birthday(Field):
     def value(self, val):
         if self.is_valid_date(val):
             self._value = val
+            self.month_day = self.parse_month_day(val)
         else:
             raise WrongDate(
                 "Invalid date. Please enter birthday in format 'DD.MM.YYYY'.")
 
 
+def celebration_date(month, day, year) -> date:
+    # Народжені 29 лютого у невисокосний рік святкують 28 лютого
+    if (month, day) == (2, 29) and not isleap(year):
+        return date(year, 2, 28)
+    return date(year, month, day)
+
+
+def next_birthday(month_day, today: date) -> date:
+    birthday = celebration_date(*month_day, today.year)
+    # Якщо цього року вже був день народження, береться наступний
+    if birthday < today:
+        birthday = celebration_date(*month_day, today.year + 1)
+    return birthday
+
+
 class Address:
+    __slots__ = ("street", "city", "country", "postcode")
+
     def __init__(self, street="", city="", country="", postcode=""):
         self.street = street
-        self.city = city
-        self.country = country
+        # Місто та країна повторюються у багатьох записах, тож
+        # інтернування залишає у пам'яті лише одну копію рядка
+        self.city = sys.intern(city) if isinstance(city, str) else city
+        self.country = sys.intern(country) if isinstance(country, str) else country
         self.postcode = postcode
 
+    def to_dict(self) -> dict:
+        return {"street": self.street, "city": self.city,
+                "country": self.country, "postcode": self.postcode}
+
     def __str__(self):
         return f"{self.street},{self.city},{self.country},{self.postcode}"
 
@@ -133,6 +203,8 @@ class Address:
 
 
 class Email:
+    __slots__ = ("_value",)
+
     def __init__(self, value=""):
         self.value = value
 
@@ -140,9 +212,14 @@ class Email:
     def is_valid_email(email):
         if email == '':
             return True
-        match = re.search(
-            r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$", email)
-        return bool(match)
+        return bool(EMAIL_PATTERN.search(email))
+
+    @classmethod
+    def trusted(cls, value):
+        """Create Email from a value read from our own storage without validation."""
+        email = cls.__new__(cls)
+        email._value = value
+        return email
 
     @property
     def value(self):
@@ -165,12 +242,41 @@ class Email:
 
 
 class Record:
+    # __weakref__ потрібен для ледачого завантаження книги (storage.LazyRecords)
+    __slots__ = ("name", "phones", "birthday", "address", "email", "book", "__weakref__")
+
     def __init__(self, name, phones=None, birthday=None, address=None, email=None):
         self.name = name
         self.phones = phones
         self.birthday = birthday
         self.address = address
         self.email = email
+        # Адресна книга, у якій зберігається запис. Через неї методи Record
+        # повідомляють про зміни (наприклад, для запису у журнал)
+        self.book = None
+
+    @classmethod
+    def from_dict(cls, name: str, record: dict, trusted: bool = False):
+        """Take as input name and record in data.json format. Return Record.
+        Values of trusted records (written by us) are not validated again."""
+        email = Email.trusted(record["email"]) if trusted else Email(record["email"])
+        return cls(Name(name),
+                   [Phone(phone) for phone in record["phones"]],
+                   Birthday(record["birthday"]),
+                   Address(**record["address"]),
+                   email)
+
+    def to_dict(self) -> dict:
+        return {
+            "phones": [phone.value for phone in self.phones],
+            "birthday": self.birthday.value if self.birthday is not None else '',
+            "address": self.address.to_dict() if self.address is not None else Address().to_dict(),
+            "email": self.email.value if self.email is not None else ''
+        }
+
+    def _changed(self, operation, *args):
+        if self.book is not None:
+            self.book.record_changed(operation, self.name.value, *args)
 
     def __str__(self):
         # Рядкове представлення Record у форматі
@@ -192,6 +298,7 @@ class Record:
         # Список телефонів приводиться до множини для того, щоб виключити можливість
         # повторення номеру телефону
         self.phones = list(set(self.phones))
+        self._changed("add_phone", phone)
         return f"Phone number {phone} is added successfully for user {self.name.value}."
 
     def change_phone(self, old_number: Phone, new_number: Phone):
@@ -202,46 +309,249 @@ class Record:
         else:
             phone_number_index = self.phones.index(old_number)
             self.phones[phone_number_index] = new_number
+            self._changed("change_phone", old_number, new_number)
             return f"The phone number {old_number} for the user {self.name} "\
                 f"has been changed to {new_number}"
 
     def delete_phone(self, phone):
         try:
             self.phones.remove(phone)
+            self._changed("delete_phone", phone)
             return f"Phone number {phone} for user {self.name} deleted successfully."
         except ValueError:
             return f"Phone number {phone} for user {self.name} not found"
 
     def days_to_birthday(self):
-        try:
-            birthday = datetime.strptime(str(self.birthday), "%d.%m.%Y").date()
-        except ValueError:
+        if self.birthday is None or self.birthday.month_day is None:
             return f"No birthday for user {self.name.value}"
 
         today = date.today()
-        birthday = birthday.replace(year=today.year)
-        # Якщо цього року вже був день народження, кількість днів рахується до наступного
-        # дня народження
-        if birthday < today:
-            birthday = birthday.replace(year=today.year+1)
+        birthday = next_birthday(self.birthday.month_day, today)
         result = (birthday - today).days
         birthday_str = birthday.strftime("%d %B")
         return f"The birthday of user {self.name} will be in {result} days, {birthday_str}"
 
     def change_birthday(self, birthday: Birthday):
         self.birthday = birthday
+        self._changed("change_birthday", birthday)
         return f"Birthday date for user {self.name.value} is changed to {birthday} successfully."
 
     def change_address(self, address: Address):
         self.address = address
+        self._changed("change_address", address)
         return f"Address {address} for user {self.name.value} is changed successfully."
 
     def change_email(self, new_email: Email):
         self.email = new_email
+        self._changed("change_email", new_email)
         return f"Email {new_email} for user {self.name.value} is changed successfully."
 
 
+class SearchIndex:
+    """Inverted index of trigrams over names, phone numbers and
+    lowercased emails of AddressBook records."""
+
+    GRAM = 3
+
+    def __init__(self):
+        self.grams = {"name": defaultdict(set),
+                      "phone": defaultdict(set),
+                      "email": defaultdict(set)}
+        # Значення, за якими запис проіндексовано зараз, потрібні, щоб
+        # прибрати старі n-грами після зміни запису
+        self.values = {}
+        # Порядок додавання записів, щоб результати пошуку йшли у тому ж
+        # порядку, що і в самій книзі
+        self.order = {}
+        self.counter = count()
+
+    @classmethod
+    def split(cls, value: str) -> set:
+        return {value[start:start + cls.GRAM]
+                for start in range(len(value) - cls.GRAM + 1)}
+
+    @staticmethod
+    def record_values(record) -> dict:
+        email = record.email.value if record.email is not None else ''
+        return {"name": (record.name.value,),
+                "phone": tuple(phone.value for phone in record.phones),
+                "email": (email.lower(),)}
+
+    def add(self, name, record):
+        self.remove(name, keep_order=True)
+        values = self.record_values(record)
+        for field, field_values in values.items():
+            for value in field_values:
+                for gram in self.split(value):
+                    self.grams[field][gram].add(name)
+        self.values[name] = values
+        if name not in self.order:
+            self.order[name] = next(self.counter)
+
+    def remove(self, name, keep_order=False):
+        values = self.values.pop(name, None)
+        if values is None:
+            return
+        for field, field_values in values.items():
+            for value in field_values:
+                for gram in self.split(value):
+                    names = self.grams[field][gram]
+                    names.discard(name)
+                    if not names:
+                        del self.grams[field][gram]
+        if not keep_order:
+            del self.order[name]
+
+    def find(self, field: str, text: str) -> list:
+        if field == "email":
+            text = text.lower()
+        if len(text) < self.GRAM:
+            # Короткий запит підходить до великої частини книги, тож
+            # індекс тут не допоможе - перевіряємо усі значення
+            names = [name for name, values in self.values.items()
+                     if any(text in value for value in values[field])]
+        else:
+            # Рядок містить усі свої триграми. Перетин їх множин дає
+            # кандидатів, а перевірка через in відкидає випадкові збіги
+            postings = sorted((self.grams[field].get(text[start:start + self.GRAM], set())
+                               for start in range(len(text) - self.GRAM + 1)),
+                              key=len)
+            candidates = postings[0].intersection(*postings[1:])
+            names = [name for name in candidates
+                     if any(text in value for value in self.values[name][field])]
+        return sorted(names, key=self.order.__getitem__)
+
+
+class BirthdayCalendar:
+    """Names of AddressBook records in 366 buckets by day of the year
+    of their birthday."""
+
+    def __init__(self):
+        self.buckets = [set() for _ in range(366)]
+        self.days = {}
+        # Порядок додавання записів, щоб іменинники одного дня йшли у тому ж
+        # порядку, що і в самій книзі
+        self.order = {}
+        self.counter = count()
+
+    @staticmethod
+    def day_of_year(month, day) -> int:
+        # 2000 - високосний рік, тож у ньому є усі можливі дні народження
+        return date(2000, month, day).timetuple().tm_yday - 1
+
+    def add(self, name, record):
+        self.remove(name, keep_order=True)
+        if name not in self.order:
+            self.order[name] = next(self.counter)
+        if record.birthday is None or record.birthday.month_day is None:
+            return
+        day = self.day_of_year(*record.birthday.month_day)
+        self.buckets[day].add(name)
+        self.days[name] = day
+
+    def remove(self, name, keep_order=False):
+        day = self.days.pop(name, None)
+        if day is not None:
+            self.buckets[day].discard(name)
+        if not keep_order:
+            self.order.pop(name, None)
+
+    def upcoming(self, start: date, days: int):
+        """Yield (date, name) for birthdays from start to start + days."""
+        seen = set()
+        for offset in range(days + 1):
+            current = start + timedelta(days=offset)
+            buckets = [self.day_of_year(current.month, current.day)]
+            if (current.month, current.day) == (2, 28) and not isleap(current.year):
+                buckets.append(self.day_of_year(2, 29))
+            names = []
+            for day in buckets:
+                # Кожен кошик переглядається лише раз, навіть якщо проміжок
+                # захоплює той самий день наступного року
+                if day in seen:
+                    continue
+                seen.add(day)
+                names.extend(self.buckets[day])
+            for name in sorted(names, key=self.order.__getitem__):
+                yield current, name
+
+    def names(self):
+        """Yield names by day of the year of birthday, then names without birthday."""
+        for bucket in self.buckets:
+            yield from sorted(bucket, key=self.order.__getitem__)
+        yield from (name for name in self.order if name not in self.days)
+
+
+class UpcomingBirthdays:
+    """Lazy result of AddressBook.show_birthday.
+    Iteration yields (date, Record) ordered by date."""
+
+    def __init__(self, book, start: date, days: int):
+        self.book = book
+        self.start = start
+        self.days = days
+
+    def __iter__(self):
+        for day, name in self.book.birthday_calendar.upcoming(self.start, self.days):
+            yield day, self.book.data[name]
+
+    def __bool__(self):
+        return any(True for _ in self)
+
+    def __str__(self):
+        return "\n".join(f'{day.strftime("%d.%m.%Y")}: {record.name.value}'
+                         for day, record in self)
+
+
 class AddressBook(UserDict):
+    def __init__(self, *args, **kwargs):
+        # listeners - це функції, що викликаються при кожній зміні книги
+        # з аргументами (operation, name, *args). Так працює журнал змін
+        self.listeners = []
+        # Індекси для пошуку та днів народження будуються при першому
+        # використанні і далі оновлюються разом зі змінами книги
+        self._search_index = None
+        self._birthday_calendar = None
+        self._sorted_names = None
+        # Лічильник змін, за яким похідні дані (наприклад, columnar.ColumnarView)
+        # визначають, що їх треба перебудувати
+        self.version = 0
+        super().__init__(*args, **kwargs)
+
+    def __setitem__(self, name, record):
+        self.data[name] = record
+        record.book = self
+        self.record_changed("put", name, record)
+
+    def __delitem__(self, name):
+        record = self.data.pop(name)
+        record.book = None
+        self.record_changed("delete_record", name)
+
+    def record_changed(self, operation, name, *args):
+        self.version += 1
+        if self._search_index is not None:
+            if operation == "delete_record":
+                self._search_index.remove(name)
+            elif operation in ("put", "add_phone", "change_phone",
+                               "delete_phone", "change_email"):
+                self._search_index.add(name, self.data[name])
+        if self._birthday_calendar is not None:
+            if operation == "delete_record":
+                self._birthday_calendar.remove(name)
+            elif operation in ("put", "change_birthday"):
+                self._birthday_calendar.add(name, self.data[name])
+        if self._sorted_names is not None:
+            position = bisect_left(self._sorted_names, name)
+            present = (position < len(self._sorted_names)
+                       and self._sorted_names[position] == name)
+            if operation == "delete_record" and present:
+                del self._sorted_names[position]
+            elif operation == "put" and not present:
+                self._sorted_names.insert(position, name)
+        for listener in self.listeners:
+            listener(operation, name, *args)
+
     def add_record(self, record):
         self[record.name.value] = record
 
@@ -252,47 +562,43 @@ class AddressBook(UserDict):
         self[new_record.name.value] = new_record
 
     def search(self, field: str, text: str) -> list[Record]:
-        result = []
-        if field.lower() == "name":
-            for record in self.data.values():
-                if text in record.name.value:
-                    result.append(record)
-        elif field.lower() == "phone":
-            for record in self.data.values():
-                for phone in record.phones:
-                    if text in phone.value:
-                        result.append(record)
-        elif field.lower() == "email":
-            for record in self.data.values():
-                if text.lower() in record.email.value.lower():
-                    result.append(record)
-        return result
-
-    def show_birthday(self, days: int):
-        result_list = []
-        result_to_print = []
-        now = datetime.today()
-        start_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        for record in self.data.values():
-            if record.birthday.value:
-                birthday = datetime.strptime(str(record.birthday.value), "%d.%m.%Y")
-                birthday = birthday.replace(year=start_date.year)
-                if birthday < start_date:
-                    birthday = birthday.replace(year=start_date.year+1)
-                gap = birthday - start_date
-                gap = gap.days
-                result_list.append([str(record.name.value), birthday, gap])
-        result_list = sorted(result_list, key=lambda person: person[2])
-        result_to_print = [f'{value[1].strftime("%d.%m.%Y")}: {value[0]}' for value in result_list if value[2] <= days]
-        if result_to_print:
-            print(f"Birthdays today and within {days} next day(s):")
-            print(*result_to_print, sep='\n')
-        else:
-            if days == 1:
-                return f"There are no birthdays to show within {days} day"
-            else:
-                return f"There are no birthdays to show within {days} days"
-        return None
+        # Сховище (наприклад, SQLite) може мати власний індексований пошук
+        if hasattr(self.data, "search"):
+            return list(self.data.search(field.lower(), text))
+        if field.lower() not in ("name", "phone", "email"):
+            return []
+        if self._search_index is None:
+            self._search_index = SearchIndex()
+            for name, record in self.data.items():
+                self._search_index.add(name, record)
+        return [self.data[name]
+                for name in self._search_index.find(field.lower(), text)]
+
+    @property
+    def birthday_calendar(self) -> BirthdayCalendar:
+        if self._birthday_calendar is None:
+            self._birthday_calendar = BirthdayCalendar()
+            for name, record in self.data.items():
+                self._birthday_calendar.add(name, record)
+        return self._birthday_calendar
+
+    @property
+    def sorted_names(self) -> list:
+        if self._sorted_names is None:
+            self._sorted_names = sorted(self.data)
+        return self._sorted_names
+
+    def ordered(self, order: str):
+        """Return names of records ordered by name or by birthday."""
+        if order == "name":
+            return self.sorted_names
+        if order == "birthday":
+            return self.birthday_calendar.names()
+        raise ValueError(f"Unknown order {order}")
+
+    def show_birthday(self, days: int) -> UpcomingBirthdays:
+        """Return birthdays today and within days next days"""
+        return UpcomingBirthdays(self, date.today(), days)
 
     @classmethod
     def open_file(cls, filename):
@@ -301,58 +607,23 @@ class AddressBook(UserDict):
             with open(filename, encoding="utf-8") as file:
                 json_data = json.load(file)
                 data = cls()
+                # Файл записала сама програма, тож значення вже перевірені
                 for name, record in json_data.items():
-                    name = Name(name)
-                    phones = [Phone(phone) for phone in record["phones"]]
-                    birthday = Birthday(record["birthday"])
-                    address = Address(**record["address"])
-                    email = Email(record["email"])
-
-                    data.add_record(
-                        Record(name, phones, birthday, address, email))
+                    data.add_record(Record.from_dict(name, record, trusted=True))
         except FileNotFoundError:
             data = cls()
         return data
 
     def write_to_file(self, filename: str):
-        json_data = {}
-
-        for name, record in self.data.items():
-            json_data[name] = {
-                "phones": [phone.value for phone in record.phones],
-                "birthday": record.birthday.value if record.birthday is not None else '',
-                "address": {
-                    "street": record.address.street if record.address is not None else '',
-                    "city": record.address.city if record.address is not None else '',
-                    "country": record.address.country if record.address is not None else '',
-                    "postcode": record.address.postcode if record.address is not None else '',
-                },
-                "email": record.email.value if record.email is not None else ''
-            }
-        with open(filename, "w", encoding="utf-8") as file:
+        json_data = {name: record.to_dict() for name, record in self.data.items()}
+        with atomic_write(filename, encoding="utf-8") as file:
             json.dump(json_data, file, indent=4, ensure_ascii=False)
 
-    # Методи __iter__ та __next__ перетворюють елземпляри AddressBook на
-    # ітератори, щоб користувачам показувати одночасно self.page_size записів
+    # Ітерація по AddressBook повертає сторінки по PAGE_SIZE записів.
+    # Стан перегляду зберігається у PageView, а не у самій книзі
 
     def __iter__(self):
-        self.current_page = 1
-        self.page_size = 10
-        self.start_index = (self.current_page - 1) * self.page_size
-        self.end_index = self.start_index + self.page_size
-        return self
-
-    def __next__(self):
-        if self.start_index >= len(self.data):
-            raise StopIteration
-
-        page_records = list(self.data.values())[
-            self.start_index:self.end_index]
-        self.start_index = self.end_index
-        self.end_index = self.start_index + self.page_size
-        self.current_page += 1
-
-        return page_records
+        return PageView(self)
 
 
 if __name__ == "__main__":
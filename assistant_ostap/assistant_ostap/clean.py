@@ -1,118 +1,754 @@
 import sys
 import shutil
+import hashlib
+import json
 import os
+import tarfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
+from time import monotonic, perf_counter
+
+from assistant_ostap.assistant_ostap.prompts import ask
 
 CATEGORIES = {
-    'archives': ['.rar', '.zip'],
+    'archives': ['.rar', '.zip', '.tar', '.tar.gz', '.tgz'],
     'audio': ['.mp3', '.wav'],
     'documents': ['.docx', '.pptx'],
     'video': ['.avi', '.mp4'],
     'images': ['.jpeg', '.png']
 }
 
+# Сигнатури на початку файлу для файлів без відомого розширення
+MAGIC = {
+    'archives': [b'PK\x03\x04', b'Rar!\x1a\x07', b'\x1f\x8b'],
+    'audio': [b'ID3'],
+    'images': [b'\x89PNG\r\n\x1a\n', b'\xff\xd8\xff'],
+}
+
+CONFIG_FILE = Path.home().joinpath('.ostap_clean.json')
+INDEX_FILE = '.ostap_index.json'
+INDEX_VERSION = 1
+
+# Переміщення впираються в диск, а не в процесор, тож потоків більше, ніж ядер
+WORKERS = min(32, (os.cpu_count() or 1) + 4)
+BATCH_SIZE = 1000
+
+# Розпакування навантажує процесор, тож процесів не більше, ніж ядер
+UNPACK_WORKERS = os.cpu_count() or 1
+UNPACK_TIMEOUT = 300
+MAX_UNPACKED_SIZE = 4 << 30
+MAX_RATIO = 100
+# Архіви, менші за розпакуванням, не перевіряються на ступінь стиснення
+RATIO_FREE_SIZE = 16 << 20
+CHUNK_SIZE = 1 << 20
+# Скільки байтів з початку та кінця файлу хешувати на першому проході
+PARTIAL_HASH_SIZE = 64 << 10
+
+
+class BadArchive(Exception):
+    pass
+
+
+class BadConfig(Exception):
+    pass
+
 
 def move_file(path: Path, root_dir: Path, cat: str) -> None:
     target_dir = root_dir.joinpath(cat)
-    if not target_dir.exists():
-        target_dir.mkdir()
-    new_name = target_dir.joinpath(f"{(path.stem)}{path.suffix}")
+    target_dir.mkdir(exist_ok=True)
+    new_name = target_dir.joinpath(free_name(path.name, set(os.listdir(target_dir))))
     path.replace(new_name)
 
 
+def free_name(name: str, taken) -> str:
+    """Return name, or name with ' (1)', ' (2)'... before the suffix
+    if it is already taken."""
+    if name not in taken:
+        return name
+    suffix = RULES.known_suffix(Path(name)) or Path(name).suffix
+    stem = name[:len(name) - len(suffix)]
+    suffix = name[len(stem):]
+    number = 1
+    while f"{stem} ({number}){suffix}" in taken:
+        number += 1
+    return f"{stem} ({number}){suffix}"
+
+
+class CategoryRules:
+    """Lookup table from file suffixes (including multi-part ones like
+    .tar.gz) to categories, with optional sniffing of magic bytes."""
+
+    def __init__(self, categories: dict, magic: dict = None, sniff: bool = False):
+        self.categories = list(categories)
+        self.suffixes = {}
+        for cat, exts in categories.items():
+            for ext in exts:
+                ext = ext.lower()
+                if not ext.startswith('.'):
+                    ext = '.' + ext
+                self.suffixes[ext] = cat
+        self.parts = max((ext.count('.') for ext in self.suffixes), default=1)
+        self.magic = [(signature, cat)
+                      for cat, signatures in (magic or {}).items()
+                      for signature in signatures]
+        # Довші сигнатури перевіряємо першими
+        self.magic.sort(key=lambda item: len(item[0]), reverse=True)
+        self.magic_size = max((len(item[0]) for item in self.magic), default=0)
+        self.sniff = sniff and bool(self.magic)
+
+    def known_suffix(self, path: Path):
+        """Return the longest known suffix of the file or None."""
+        suffixes = [suffix.lower() for suffix in path.suffixes[-self.parts:]]
+        for i in range(len(suffixes)):
+            suffix = ''.join(suffixes[i:])
+            if suffix in self.suffixes:
+                return suffix
+        return None
+
+    def sniff_file(self, path: Path):
+        """Return category by the first bytes of the file or None."""
+        try:
+            with open(path, 'rb') as file:
+                head = file.read(self.magic_size)
+        except OSError:
+            return None
+        for signature, cat in self.magic:
+            if head.startswith(signature):
+                return cat
+        return None
+
+    def classify(self, path: Path, sniff: bool = None) -> str:
+        suffix = self.known_suffix(path)
+        if suffix is not None:
+            return self.suffixes[suffix]
+        if self.sniff if sniff is None else sniff:
+            return self.sniff_file(path) or 'Other'
+        return 'Other'
+
+
+def load_rules(filename=None) -> CategoryRules:
+    """Build category rules from CATEGORIES and the user config file.
+
+    The config is a JSON object like
+    {"categories": {"ebooks": [".epub", ".fb2"]},
+     "magic": {"ebooks": ["504b0304"]}, "sniff": true}
+    Its categories are added to the default ones (or replace them if
+    the name is the same), signatures are given in hex.
+    Raise BadConfig with the file name if the config is invalid."""
+    filename = filename or os.environ.get('OSTAP_CLEAN_CONFIG') or CONFIG_FILE
+    categories = dict(CATEGORIES)
+    magic = {cat: list(signatures) for cat, signatures in MAGIC.items()}
+    sniff = False
+    if os.path.isfile(filename):
+        try:
+            with open(filename, 'r', encoding='utf-8') as file:
+                config = json.load(file)
+            categories.update(config.get('categories', {}))
+            for cat, signatures in config.get('magic', {}).items():
+                magic.setdefault(cat, []).extend(
+                    bytes.fromhex(signature) for signature in signatures)
+            sniff = bool(config.get('sniff', False))
+            return CategoryRules(categories, magic, sniff)
+        except (OSError, ValueError, TypeError, AttributeError) as error:
+            raise BadConfig(f"Invalid config {filename}: {error}") from error
+    return CategoryRules(categories, magic, sniff)
+
+
+# Правила з файлу налаштувань завантажує main, тож помилка у ньому
+# не ламає імпорт модуля
+RULES = CategoryRules(CATEGORIES, MAGIC)
+
+
 def get_categories(path: Path) -> str:
-    ext = path.suffix.lower()
-    for cat, exts in CATEGORIES.items():
-        if ext in exts:
-            return cat
-    return 'Other'
+    return RULES.classify(path)
 
 
-def sort_folder(path: Path) -> None:
-    ignore_path = []
+class FolderIndex:
+    """Listings of category folders kept in INDEX_FILE between runs.
+    A listing is reused while the modification time of its folder is
+    unchanged, so sorted folders are not read again."""
 
-    for i in CATEGORIES:
-        path_to_ignore = path.joinpath(i)
-        ignore_path.append(path_to_ignore)
+    def __init__(self, root: Path):
+        self.root = root
+        # Відносний шлях теки -> {'mtime', 'files': {ім'я: [розмір, mtime, категорія]}, 'dirs'}
+        self.dirs = {}
 
-    for item in path.glob('**/*'):
-        need_to_ignore = False
-        if item.is_file():
-            cat = get_categories(item)
-            for check in ignore_path:
-                if check not in list(item.parents):
-                    continue
+    @classmethod
+    def load(cls, root: Path):
+        index = cls(root)
+        try:
+            with open(root.joinpath(INDEX_FILE), 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return index
+        if data.get('version') == INDEX_VERSION:
+            index.dirs = data['dirs']
+        return index
+
+    def save(self):
+        filename = self.root.joinpath(INDEX_FILE)
+        temp = filename.with_name(filename.name + '.tmp')
+        with open(temp, 'w', encoding='utf-8') as file:
+            json.dump({'version': INDEX_VERSION, 'dirs': self.dirs}, file)
+        os.replace(temp, filename)
+
+    def key(self, dirpath) -> str:
+        return os.path.relpath(dirpath, self.root).replace(os.sep, '/')
+
+    def forget(self, key: str):
+        """Drop the folder and all its subfolders from the index."""
+        prefix = key + '/'
+        for name in [name for name in self.dirs if name == key or name.startswith(prefix)]:
+            del self.dirs[name]
+
+    def listing(self, dirpath) -> dict:
+        """Return listing of the folder, reading it only if it changed."""
+        key = self.key(dirpath)
+        # mtime беремо до читання, тож зміни під час читання помітить наступний запуск
+        mtime = os.stat(dirpath).st_mtime_ns
+        entry = self.dirs.get(key)
+        if entry is not None and entry['mtime'] == mtime:
+            return entry
+        cat = key.split('/')[0]
+        files = {}
+        subdirs = []
+        with os.scandir(dirpath) as entries:
+            for item in entries:
+                if item.is_dir(follow_symlinks=False):
+                    subdirs.append(item.name)
                 else:
-                    need_to_ignore = True
-                    break
-            if need_to_ignore is False:
-                move_file(item, path, cat)
-    for item in path.glob('**/*'):
-        if item.is_dir():
-            new_path = item.parent.joinpath((item.name))
-            item.replace(new_path)
+                    stat = item.stat(follow_symlinks=False)
+                    files[item.name] = [stat.st_size, stat.st_mtime_ns, cat]
+        if entry is not None:
+            for name in set(entry['dirs']).difference(subdirs):
+                self.forget(f"{key}/{name}")
+        entry = self.dirs[key] = {'mtime': mtime, 'files': files, 'dirs': subdirs}
+        return entry
+
+    def scan_tree(self, dirpath):
+        """Bring listings of the folder and its subfolders up to date."""
+        stack = [dirpath]
+        while stack:
+            dirpath = stack.pop()
+            entry = self.listing(dirpath)
+            stack.extend(os.path.join(dirpath, name) for name in entry['dirs'])
+
+    def update_files(self, paths):
+        """Update entries of changed, added or removed files in indexed folders."""
+        touched = {}
+        for item in paths:
+            dirpath, name = os.path.split(item)
+            key = self.key(dirpath)
+            entry = self.dirs.get(key)
+            if entry is None:
+                # Непроіндексовану теку прочитає наступний запуск
+                continue
+            try:
+                stat = os.stat(item, follow_symlinks=False)
+            except FileNotFoundError:
+                entry['files'].pop(name, None)
+            else:
+                entry['files'][name] = [stat.st_size, stat.st_mtime_ns, key.split('/')[0]]
+            touched[key] = dirpath
+        for key, dirpath in touched.items():
+            self.dirs[key]['mtime'] = os.stat(dirpath).st_mtime_ns
+
+    def apply(self, plan):
+        """Record in the index the changes made by the executed plan."""
+        for item in plan.mkdirs:
+            self.dirs.setdefault(self.key(item), {'mtime': 0, 'files': {}, 'dirs': []})
+        # Видалені теки прибираються і з індексу, і зі списку тек батьківської
+        # теки, інакше наступний обхід спробує їх прочитати
+        for item in plan.removals:
+            key = self.key(item)
+            self.forget(key)
+            parent_key, _, name = key.rpartition('/')
+            parent = self.dirs.get(parent_key) if parent_key else None
+            if parent is not None and name in parent['dirs']:
+                parent['dirs'].remove(name)
+                parent['mtime'] = os.stat(item.parent).st_mtime_ns
+        self.update_files(target for _, target in plan.moves)
+        for _, target in plan.unpacks:
+            entry = self.dirs.get(self.key(target.parent))
+            if entry is None or not target.is_dir():
+                continue
+            if target.name not in entry['dirs']:
+                entry['dirs'].append(target.name)
+            entry['mtime'] = os.stat(target.parent).st_mtime_ns
+            self.scan_tree(target)
+
+    def files(self, key: str = None):
+        """Yield paths of indexed files, only under the folder key if given."""
+        prefix = f"{key}/"
+        for name, entry in self.dirs.items():
+            if key is None or name == key or name.startswith(prefix):
+                dirpath = self.root.joinpath(name)
+                for filename in entry['files']:
+                    yield dirpath.joinpath(filename)
+
+
+class Plan:
+    """Changes to the folder collected by a single traversal: folders to
+    create, files to move, empty folders to remove and archives to unpack."""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.mkdirs = []
+        self.moves = []
+        self.removals = []
+        self.unpacks = []
+
+    def __len__(self):
+        return len(self.mkdirs) + len(self.moves) + len(self.removals) + len(self.unpacks)
+
+    def __str__(self):
+        def rel(item):
+            return os.path.relpath(item, self.root)
+
+        lines = [f"Create folder: {rel(item)}" for item in self.mkdirs]
+        lines.extend(f"Move: {rel(source)} -> {rel(target)}" for source, target in self.moves)
+        lines.extend(f"Remove empty folder: {rel(item)}" for item in self.removals)
+        lines.extend(f"Unpack: {rel(source)} -> {rel(target)}" for source, target in self.unpacks)
+        return "\n".join(lines)
+
+
+def plan_folder(path: Path, remove_empty: bool = True, unpack: bool = True,
+                index: FolderIndex = None) -> Plan:
+    """Walk the folder once and plan sorting of its files into category
+    subfolders, removal of folders left empty and unpacking of archives.
+    Category folders are read through the index."""
+    plan = Plan(path)
+    if index is None:
+        index = FolderIndex(path)
+    category_dirs = {os.path.join(path, cat): cat for cat in RULES.categories}
+    category_dirs.setdefault(os.path.join(path, 'Other'), 'Other')
+    # Імена, які вже є в теках категорій, щоб не перезаписати файли
+    taken = {cat: set() for cat in category_dirs.values()}
+    existing = set()
+    to_move = []
+    archived = []
+    kept = set()
+    dirs = []
+
+    archives_dir = os.path.join(path, 'archives')
+    stack = [(os.fspath(path), None)]
+    while stack:
+        dirpath, cat = stack.pop()
+        dirs.append(dirpath)
+        if cat is not None:
+            # Файли в теках категорій лишаються на місці
+            entry = index.listing(dirpath)
+            if entry['files']:
+                kept.add(dirpath)
+            if dirpath in category_dirs:
+                taken[cat].update(entry['files'])
+                taken[cat].update(entry['dirs'])
+            if dirpath == archives_dir:
+                archived.extend(Path(dirpath, name) for name in entry['files'])
+            stack.extend((os.path.join(dirpath, name), cat) for name in entry['dirs'])
+            continue
+        with os.scandir(dirpath) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    sub_cat = None
+                    if dirpath == os.fspath(path) and entry.path in category_dirs:
+                        sub_cat = category_dirs[entry.path]
+                        existing.add(sub_cat)
+                    stack.append((entry.path, sub_cat))
+                elif entry.is_file(follow_symlinks=False):
+                    if dirpath == os.fspath(path) and entry.name.startswith(INDEX_FILE):
+                        continue
+                    to_move.append(Path(entry.path))
+                else:
+                    # Посилання лишаються на місці
+                    kept.add(dirpath)
+
+    unpack_dirs = set()
+
+    def plan_unpack(item: Path):
+        if RULES.classify(item, sniff=False) != 'archives':
+            return
+        suffix = RULES.known_suffix(item)
+        target = path.joinpath('archives', item.name[:len(item.name) - len(suffix)])
+        if target.name in taken['archives'] or target in unpack_dirs:
+            return
+        unpack_dirs.add(target)
+        plan.unpacks.append((item, target))
+
+    for item in to_move:
+        cat = RULES.classify(item)
+        if cat not in existing:
+            existing.add(cat)
+            plan.mkdirs.append(path.joinpath(cat))
+        name = free_name(item.name, taken[cat])
+        taken[cat].add(name)
+        target = path.joinpath(cat, name)
+        plan.moves.append((item, target))
+        kept.add(os.path.dirname(target))
+        if unpack:
+            plan_unpack(target)
+    if unpack:
+        for item in archived:
+            plan_unpack(item)
+
+    if remove_empty:
+        # Теки обходили від батьків до дітей, тож у зворотному порядку
+        # вкладені теки перевіряються раніше за батьківські
+        for dirpath in reversed(dirs[1:]):
+            if dirpath in kept:
+                kept.add(os.path.dirname(dirpath))
+            else:
+                plan.removals.append(Path(dirpath))
+    return plan
+
+
+def execute_plan(plan: Plan, workers: int = WORKERS, batch_size: int = BATCH_SIZE) -> int:
+    """Apply the plan moving files in batches with a pool of workers
+    threads. Return the number of moved files."""
+    started = perf_counter()
+    for item in plan.mkdirs:
+        item.mkdir(exist_ok=True)
+
+    moved = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Пакетами, щоб у пулі не висіли задачі для всіх файлів одразу
+        for start in range(0, len(plan.moves), batch_size):
+            batch = plan.moves[start:start + batch_size]
+            for _ in executor.map(lambda move: move[0].replace(move[1]), batch):
+                moved += 1
+
+    for item in plan.removals:
+        print("Removing empty folder:", item)
+        os.rmdir(item)
+
+    elapsed = perf_counter() - started
+    rate = moved / elapsed if elapsed else 0
+    print(f"Moved {moved} files in {elapsed:.2f} s ({rate:.0f} files/s)")
+    unpack_archives(plan.unpacks)
+    return moved
+
+
+def sort_folder(path: Path, workers: int = WORKERS) -> int:
+    """Move files from the folder into category subfolders using a pool
+    of workers threads. Return the number of moved files."""
+    return execute_plan(plan_folder(path, remove_empty=False, unpack=False), workers)
+
+
+def copy_limited(source, target, budget: int, deadline: float) -> int:
+    """Copy file object by chunks, failing when more than budget bytes
+    are written or the deadline passes. Return the number of bytes."""
+    written = 0
+    while True:
+        chunk = source.read(CHUNK_SIZE)
+        if not chunk:
+            return written
+        written += len(chunk)
+        if written > budget:
+            raise BadArchive("unpacked size exceeds the limit")
+        if monotonic() > deadline:
+            raise BadArchive("timeout")
+        target.write(chunk)
+
+
+def safe_target(target: Path, name: str) -> Path:
+    """Return path of the archive member inside target folder."""
+    member = os.path.normpath(name.replace('\\', '/'))
+    if os.path.isabs(member) or member.split(os.sep)[0] == '..':
+        raise BadArchive(f"unsafe member path {name}")
+    return target.joinpath(member)
+
+
+def extract_archive(source: Path, target: Path, max_size: int = MAX_UNPACKED_SIZE,
+                    max_ratio: int = MAX_RATIO, timeout: float = UNPACK_TIMEOUT) -> int:
+    """Unpack zip or tar archive into target folder, streaming members to
+    disk and guarding against archive bombs. Return unpacked bytes."""
+    deadline = monotonic() + timeout
+    packed = max(os.path.getsize(source), 1)
+    # Ліміт рахуємо і за заявленими розмірами, і за реально записаними
+    budget = min(max_size, max(packed * max_ratio, RATIO_FREE_SIZE))
+    written = 0
+
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            members = archive.infolist()
+            if sum(member.file_size for member in members) > budget:
+                raise BadArchive("declared size exceeds the limit")
+            for member in members:
+                path = safe_target(target, member.filename)
+                if member.is_dir():
+                    path.mkdir(parents=True, exist_ok=True)
+                    continue
+                path.parent.mkdir(parents=True, exist_ok=True)
+                with archive.open(member) as src, open(path, 'wb') as dst:
+                    written += copy_limited(src, dst, budget - written, deadline)
+    elif tarfile.is_tarfile(source):
+        with tarfile.open(source) as archive:
+            for member in archive:
+                path = safe_target(target, member.name)
+                if member.isdir():
+                    path.mkdir(parents=True, exist_ok=True)
+                elif member.isfile():
+                    if written + member.size > budget:
+                        raise BadArchive("declared size exceeds the limit")
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    with archive.extractfile(member) as src, open(path, 'wb') as dst:
+                        written += copy_limited(src, dst, budget - written, deadline)
+                # Посилання та пристрої з архівів не відтворюємо
+    else:
+        raise BadArchive("unsupported archive format")
+    return written
+
+
+def unpack_one(source: Path, target: Path) -> int:
+    """Unpack the archive, removing partly unpacked files on failure.
+    A target folder that existed before is never removed."""
+    created = not target.exists()
+    try:
+        return extract_archive(source, target)
+    except Exception:
+        if created:
+            shutil.rmtree(target, ignore_errors=True)
+        raise
+
+
+def unpack_archives(unpacks, workers: int = UNPACK_WORKERS) -> int:
+    """Unpack pairs (archive, folder) in a pool of workers processes and
+    print a summary. Return the number of unpacked bytes."""
+    if not unpacks:
+        return 0
+    started = perf_counter()
+    results = []
+    if len(unpacks) == 1:
+        # Для одного архіву запускати процеси дорожче, ніж розпакувати
+        source, target = unpacks[0]
+        try:
+            results.append((source, unpack_one(source, target)))
+        except Exception as error:
+            results.append((source, error))
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(unpacks))) as executor:
+            futures = [(source, executor.submit(unpack_one, source, target))
+                       for source, target in unpacks]
+            for source, future in futures:
+                try:
+                    results.append((source, future.result()))
+                except Exception as error:
+                    results.append((source, error))
+
+    unpacked = 0
+    done = 0
+    for source, result in results:
+        if isinstance(result, Exception):
+            print(f"Can't unpack {source}: {result}")
+        else:
+            unpacked += result
+            done += 1
+    elapsed = perf_counter() - started
+    rate = unpacked / elapsed / (1 << 20) if elapsed else 0
+    print(f"Unpacked {done} of {len(unpacks)} archives, {unpacked / (1 << 20):.1f} MB "
+          f"in {elapsed:.2f} s ({rate:.1f} MB/s)")
+    return unpacked
 
 
 def unpack_archive(path: Path):
+    unpacks = []
     for item in path.glob('**/*'):
         if item.is_file():
-            cat = get_categories(item)
-            if cat == 'archives':
-                new_path = path.joinpath(cat).joinpath(item.stem)
-                shutil.unpack_archive(item, new_path)
+            # Розпаковуємо лише за розширенням, бо документи на зразок
+            # .docx за вмістом теж є zip-архівами
+            cat = RULES.classify(item, sniff=False)
+            target = path.joinpath(cat).joinpath(item.stem)
+            # Як і plan_folder, не розпаковуємо у вже наявну теку
+            if cat == 'archives' and not target.exists():
+                unpacks.append((item, target))
+    return unpack_archives(unpacks)
+
+
+def file_hash(path: Path, partial: bool = False) -> bytes:
+    """Return blake2b digest of the file, or only of its first and last
+    PARTIAL_HASH_SIZE bytes if partial is set."""
+    digest = hashlib.blake2b()
+    with open(path, 'rb') as file:
+        if partial:
+            digest.update(file.read(PARTIAL_HASH_SIZE))
+            size = file.seek(0, os.SEEK_END)
+            # Кінець читається з місця, де закінчився початок, якщо файл
+            # коротший за два шматки, тож такий файл хешується повністю
+            if size > PARTIAL_HASH_SIZE:
+                file.seek(max(PARTIAL_HASH_SIZE, size - PARTIAL_HASH_SIZE))
+                digest.update(file.read(PARTIAL_HASH_SIZE))
+        else:
+            for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+    return digest.digest()
+
+
+def group_by(paths, key, workers: int = WORKERS):
+    """Split paths into groups with equal key(path), computing keys in
+    a pool of threads. Groups with a single path are dropped."""
+    groups = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for path, value in zip(paths, executor.map(key, paths)):
+            if value is not None:
+                groups.setdefault(value, []).append(path)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def find_duplicates(files, workers: int = WORKERS):
+    """Return groups of byte-identical files. Files are compared by size,
+    then by a partial hash and only then read fully."""
+    by_size = {}
+    inodes = set()
+    for item in files:
+        try:
+            stat = os.stat(item)
+        except OSError:
+            continue
+        # Жорсткі посилання на той самий файл уже не займають місця
+        if stat.st_size == 0 or (stat.st_dev, stat.st_ino) in inodes:
+            continue
+        inodes.add((stat.st_dev, stat.st_ino))
+        by_size.setdefault(stat.st_size, []).append(item)
+
+    def safe_hash(path, partial):
+        try:
+            return file_hash(path, partial)
+        except OSError:
+            return None
+
+    duplicates = []
+    for size, group in by_size.items():
+        if len(group) < 2:
+            continue
+        for candidates in group_by(group, lambda path: safe_hash(path, True), workers):
+            if size <= 2 * PARTIAL_HASH_SIZE:
+                # Частковий хеш уже охопив увесь файл
+                duplicates.append(candidates)
+            else:
+                duplicates.extend(group_by(candidates, lambda path: safe_hash(path, False), workers))
+    # Першим лишається файл з найкоротшим іменем, тобто без " (1)"
+    return [sorted(group, key=lambda path: (len(str(path)), str(path))) for group in duplicates]
+
+
+def deduplicate(files, hardlink: bool = True, workers: int = WORKERS) -> list:
+    """Replace copies of identical files with hardlinks to the first one
+    or remove them, printing reclaimed bytes. Return the handled copies."""
+    reclaimed = 0
+    handled = []
+    for original, *copies in find_duplicates(files, workers):
+        size = os.path.getsize(original)
+        for copy in copies:
+            try:
+                if hardlink:
+                    # Посилання створюємо поруч і атомарно підміняємо копію
+                    temp = f"{copy}.ostap-link"
+                    os.link(original, temp)
+                    os.replace(temp, copy)
+                else:
+                    os.remove(copy)
+            except OSError as error:
+                print(f"Can't deduplicate {copy}: {error}")
+                continue
+            reclaimed += size
+            handled.append(copy)
+    action = 'Linked' if hardlink else 'Removed'
+    print(f"{action} {len(handled)} duplicates, reclaimed {reclaimed / (1 << 20):.1f} MB")
+    return handled
+
+
+def dedup_folder(path: Path, hardlink: bool = True, index: FolderIndex = None) -> list:
+    """Deduplicate files in the category subfolders of the folder,
+    taking them from the index if it is given."""
+    if index is not None:
+        handled = deduplicate(list(index.files()), hardlink)
+        index.update_files(handled)
+        return handled
+    files = []
+    for cat in dict.fromkeys(RULES.categories + ['Other']):
+        for dirpath, _, filenames in os.walk(path.joinpath(cat)):
+            files.extend(os.path.join(dirpath, name) for name in filenames)
+    return deduplicate(files, hardlink)
 
 
 def removeEmptyFolders(path: Path, removeRoot=True):
     if not os.path.isdir(path):
         return
 
-    # remove empty subfolders
-    files = os.listdir(path)
-    if len(files):
-        for f in files:
-            fullpath = os.path.join(path, f)
-            if os.path.isdir(fullpath):
-                removeEmptyFolders(fullpath)
-
-    # if folder empty, delete it
-    files = os.listdir(path)
-    if len(files) == 0 and removeRoot:
-        print("Removing empty folder:", path)
-        os.rmdir(path)
-
-
-def get_results(path: Path):
-    know_suffix = []
-    unknown_suffix = []
-    for item in path.glob('*'):
-        print(item.name)
-        for inner in item.glob('**/*'):
-            if inner.is_file():
-                get_suf = inner.suffix.lower()
-                print(inner.name)
-                if get_suf not in know_suffix:
-                    for cat, exts in CATEGORIES.items():
-                        if get_suf in exts:
-                            know_suffix.append(get_suf)
-                    if get_suf not in unknown_suffix and get_suf not in know_suffix:
-                        unknown_suffix.append(get_suf)
-
-    print(f'Known suffix: {know_suffix}')
-    print(f'Unknown suffix: {unknown_suffix}')
+    # Обходимо теки власним стеком: os.walk до Python 3.12 рекурсивний
+    # і так само впирається в ліміт рекурсії на глибоких деревах
+    dirs = []
+    kept = set()
+    stack = [os.fspath(path)]
+    while stack:
+        dirpath = stack.pop()
+        dirs.append(dirpath)
+        with os.scandir(dirpath) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                else:
+                    kept.add(dirpath)
+
+    # У зворотному порядку вкладені теки йдуть раніше за батьківські,
+    # тож порожнечу теки видно без повторного читання
+    for dirpath in reversed(dirs):
+        if dirpath in kept:
+            kept.add(os.path.dirname(dirpath))
+        elif dirpath != dirs[0] or removeRoot:
+            print("Removing empty folder:", dirpath)
+            os.rmdir(dirpath)
+
+
+def get_results(path: Path, index: FolderIndex = None):
+    if index is None:
+        index = FolderIndex.load(path)
+    know_suffix = {}
+    unknown_suffix = {}
+    for cat in dict.fromkeys(RULES.categories + ['Other']):
+        if not path.joinpath(cat).is_dir():
+            continue
+        # Незмінені теки беруться з індексу без повторного читання
+        index.scan_tree(path.joinpath(cat))
+        print(cat)
+        for inner in index.files(cat):
+            print(inner.name)
+            get_suf = RULES.known_suffix(inner)
+            if get_suf is not None:
+                know_suffix[get_suf] = None
+            else:
+                unknown_suffix[inner.suffix.lower()] = None
+
+    print(f'Known suffix: {list(know_suffix)}')
+    print(f'Unknown suffix: {list(unknown_suffix)}')
 
 
 def main():
+    global RULES
+    try:
+        RULES = load_rules()
+    except BadConfig as error:
+        return str(error)
     try:
-        path = Path(input('Enter path of folder:'))
+        path = Path(ask('path', 'Enter path of folder:'))
     except IndexError:
         return 'No path to folder'
 
-    if not path.exists():
+    if not path.is_dir():
         return f'Folder with path {path} doesn"t exist'
-    sort_folder(path)
-    removeEmptyFolders(path, removeRoot=True)
-    unpack_archive(path)
-    get_results(path)
+    dry_run = ask('dry_run', 'Only show the plan? (y/n):').lower() in ('y', 'yes')
+    index = FolderIndex.load(path)
+    plan = plan_folder(path, index=index)
+    if dry_run:
+        # Перегляд плану нічого не змінює у теці, навіть індекс
+        return str(plan) or 'Nothing to do'
+    dedup = ask('dedup', 'Deduplicate sorted files? (link/remove/no):').lower()
+    execute_plan(plan)
+    index.apply(plan)
+    if dedup in ('link', 'remove'):
+        dedup_folder(path, hardlink=dedup == 'link', index=index)
+    get_results(path, index)
+    index.save()
     return 'All ok'
 
 
@@ -0,0 +1,78 @@
+from array import array
+from collections import Counter
+from datetime import date, timedelta
+import weakref
+
+from assistant_ostap.assistant_ostap.classes import AddressBook, BirthdayCalendar
+
+
+# Номер місяця для кожного з 366 днів високосного року
+MONTH_OF_DAY = array("B", [(date(2000, 1, 1) + timedelta(days=day)).month
+                           for day in range(366)])
+
+
+class ColumnarView:
+    """Column arrays built from AddressBook for reports over the whole book
+    (show stats). Queries of single records use indexes of AddressBook."""
+
+    _last = None
+
+    def __init__(self, book: AddressBook):
+        self.book = weakref.ref(book)
+        self.version = book.version
+        # День року народження (-1, якщо його немає)
+        self.birthdays = array("h")
+        # Міста, країни та телефони зберігаються як номери у списках
+        # cities, countries та phones
+        self.city_codes, self.country_codes = array("I"), array("I")
+        self.phone_codes = array("I")
+        city_numbers, country_numbers, phone_numbers = {}, {}, {}
+        for record in book.data.values():
+            month_day = record.birthday.month_day if record.birthday is not None else None
+            self.birthdays.append(BirthdayCalendar.day_of_year(*month_day)
+                                  if month_day else -1)
+            address = record.address
+            city = address.city if address is not None else ""
+            country = address.country if address is not None else ""
+            self.city_codes.append(city_numbers.setdefault(city, len(city_numbers)))
+            self.country_codes.append(country_numbers.setdefault(country, len(country_numbers)))
+            for phone in record.phones:
+                # Знак "+" не є частиною префікса
+                self.phone_codes.append(phone_numbers.setdefault(
+                    phone.value.replace("+", ""), len(phone_numbers)))
+        self.cities = list(city_numbers)
+        self.countries = list(country_numbers)
+        self.phones = list(phone_numbers)
+        # Кількість днів народження у кожен день року
+        counts = Counter(self.birthdays)
+        self.day_counts = array("I", [counts[day] for day in range(366)])
+
+    @classmethod
+    def of(cls, book: AddressBook) -> "ColumnarView":
+        """Return view of book, rebuild it only if book was changed"""
+        view = cls._last
+        if view is None or view.book() is not book or view.version != book.version:
+            view = cls._last = cls(book)
+        return view
+
+    def birthdays_by_month(self) -> Counter:
+        result = Counter()
+        for day in range(366):
+            result[MONTH_OF_DAY[day]] += self.day_counts[day]
+        return +result
+
+    def count_cities(self) -> Counter:
+        return Counter({self.cities[code]: number
+                        for code, number in Counter(self.city_codes).items()
+                        if self.cities[code]})
+
+    def count_countries(self) -> Counter:
+        return Counter({self.countries[code]: number
+                        for code, number in Counter(self.country_codes).items()
+                        if self.countries[code]})
+
+    def count_phone_prefixes(self, length=3) -> Counter:
+        result = Counter()
+        for code, number in Counter(self.phone_codes).items():
+            result[self.phones[code][:length]] += number
+        return result
@@ -0,0 +1,263 @@
+import csv
+from datetime import datetime
+import os
+import re
+from time import perf_counter
+
+from assistant_ostap.assistant_ostap.classes import (Address, Birthday, Email, Name,
+                                                      Phone, Record)
+
+
+# Порядок колонок CSV, у якому контакти експортуються.
+# Телефони в одній клітинці розділяються ";"
+CSV_FIELDS = ["name", "phones", "birthday", "street", "city", "country", "postcode", "email"]
+PHONE_SEPARATORS = re.compile(r"[;,]")
+# Пробіли, дефіси та дужки, якими CRM часто форматують номери
+PHONE_FORMATTING = re.compile(r"[\s\-().]")
+VCARD_ESCAPES = {"\\n": "\n", "\\N": "\n", "\\,": ",", "\\;": ";", "\\\\": "\\"}
+VCARD_ESCAPE = re.compile(r"\\[nN,;\\]")
+# Скільки помилкових рядків показувати у звіті
+SHOWN_ERRORS = 20
+
+
+class ImportReport:
+    """Counts of added and merged contacts and errors of invalid rows."""
+
+    def __init__(self):
+        self.added = 0
+        self.merged = 0
+        self.errors = []
+        self.seconds = 0.0
+
+    def __str__(self):
+        total = self.added + self.merged
+        rate = total / self.seconds if self.seconds else 0
+        lines = [f"Added {self.added} and updated {self.merged} contacts "
+                 f"in {self.seconds:.2f} s ({rate:.0f} records/s)."]
+        if self.errors:
+            lines.append(f"Skipped {len(self.errors)} invalid rows:")
+            lines.extend(f"line {line}: {error}" for line, error in self.errors[:SHOWN_ERRORS])
+            if len(self.errors) > SHOWN_ERRORS:
+                lines.append(f"... and {len(self.errors) - SHOWN_ERRORS} more")
+        return "\n".join(lines)
+
+
+def read_csv(file):
+    """Yield pairs (line number, row) from CSV file with header."""
+    reader = csv.DictReader(file)
+    if reader.fieldnames is None:
+        return
+    reader.fieldnames = [field.strip().lower() for field in reader.fieldnames]
+    for row in reader:
+        if "phones" not in row and "phone" in row:
+            row["phones"] = row["phone"]
+        yield reader.line_num, row
+
+
+def vcard_unescape(value: str) -> str:
+    return VCARD_ESCAPE.sub(lambda match: VCARD_ESCAPES[match.group()], value)
+
+
+def vcard_escape(value: str) -> str:
+    return (value.replace("\\", "\\\\").replace("\n", "\\n")
+            .replace(",", "\\,").replace(";", "\\;"))
+
+
+def vcard_birthday(value: str) -> str:
+    """Convert vCard BDAY (YYYY-MM-DD or YYYYMMDD) to DD.MM.YYYY."""
+    value = value.strip()
+    for pattern in ("%Y-%m-%d", "%Y%m%d"):
+        try:
+            return datetime.strptime(value[:10], pattern).strftime("%d.%m.%Y")
+        except ValueError:
+            continue
+    # Інші формати перевірить валідатор Birthday
+    return value
+
+
+def parse_vcard_line(line: str):
+    """Return property name, parameters and value of unfolded vCard line."""
+    head, _, value = line.partition(":")
+    name, *params = head.split(";")
+    # Група на зразок "item1.TEL" не важлива
+    name = name.rpartition(".")[2].upper()
+    return name, params, value
+
+
+def unfold(file):
+    """Yield pairs (line number, line) of vCard file joining folded lines:
+    lines that start with a space or a tab continue the previous one."""
+    pending = None
+    for number, line in enumerate(file, 1):
+        line = line.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and pending is not None:
+            pending = (pending[0], pending[1] + line[1:])
+            continue
+        if pending is not None:
+            yield pending
+        pending = (number, line)
+    if pending is not None:
+        yield pending
+
+
+def read_vcard(file):
+    """Yield pairs (line number, row) for every card in vCard file,
+    reading it line by line."""
+    card = None
+    start = 0
+    for number, line in unfold(file):
+        name, params, value = parse_vcard_line(line)
+        if name == "BEGIN" and value.upper() == "VCARD":
+            card = {"name": "", "phones": [], "birthday": "", "street": "", "city": "",
+                    "country": "", "postcode": "", "email": ""}
+            start = number
+        elif card is None:
+            continue
+        elif name == "END":
+            yield start, card
+            card = None
+        elif name == "FN":
+            card["name"] = vcard_unescape(value)
+        elif name == "N" and not card["name"]:
+            family, given, *_ = value.split(";") + [""]
+            card["name"] = " ".join(part for part in (vcard_unescape(given),
+                                                      vcard_unescape(family)) if part)
+        elif name == "TEL":
+            card["phones"].append(value)
+        elif name == "BDAY":
+            card["birthday"] = vcard_birthday(value)
+        elif name == "ADR":
+            parts = [vcard_unescape(part) for part in re.split(r"(?<!\\);", value)] + [""] * 7
+            card["street"], card["city"] = parts[2], parts[3]
+            card["postcode"], card["country"] = parts[5], parts[6]
+        elif name == "EMAIL" and not card["email"]:
+            card["email"] = value.strip()
+
+
+def record_from_row(row: dict):
+    """Validate row and return pair (Record, None) or (None, error)."""
+    name = (row.get("name") or "").strip()
+    if not Name.is_valid_name(name):
+        return None, "Name is empty"
+    phones = row.get("phones") or []
+    if isinstance(phones, str):
+        phones = PHONE_SEPARATORS.split(phones)
+    numbers = []
+    for phone in phones:
+        phone = PHONE_FORMATTING.sub("", phone)
+        if not phone:
+            continue
+        if not Phone.is_valid_phone(phone):
+            return None, f"Invalid phone '{phone}'"
+        numbers.append(Phone(phone))
+    birthday = (row.get("birthday") or "").strip()
+    if not Birthday.is_valid_date(birthday):
+        return None, f"Invalid birthday '{birthday}'"
+    email = (row.get("email") or "").strip()
+    if not Email.is_valid_email(email):
+        return None, f"Invalid email '{email}'"
+    address = Address(row.get("street") or "", row.get("city") or "",
+                      row.get("country") or "", row.get("postcode") or "")
+    # Телефони без повторів, але у порядку з файлу
+    numbers = list(dict.fromkeys(numbers))
+    return Record(Name(name), numbers, Birthday(birthday), address, Email(email)), None
+
+
+def merge_record(record: Record, other: Record):
+    """Add phones of other to record and fill fields that record lacks."""
+    for phone in other.phones:
+        if phone not in record.phones:
+            record.add_phone(phone)
+    if not (record.birthday and record.birthday.value) and other.birthday.value:
+        record.change_birthday(other.birthday)
+    if not (record.email and record.email.value) and other.email.value:
+        record.change_email(other.email)
+    if not (record.address and any(record.address.to_dict().values())) \
+            and any(other.address.to_dict().values()):
+        record.change_address(other.address)
+
+
+def import_rows(rows, book) -> ImportReport:
+    """Add or merge contacts from pairs (line number, row) into the book."""
+    report = ImportReport()
+    started = perf_counter()
+    data = book.data
+    for line, row in rows:
+        record, error = record_from_row(row)
+        if error is not None:
+            report.errors.append((line, error))
+            continue
+        existing = data.get(record.name.value)
+        if existing is None:
+            book.add_record(record)
+            report.added += 1
+        else:
+            merge_record(existing, record)
+            report.merged += 1
+    report.seconds = perf_counter() - started
+    return report
+
+
+def file_format(filename: str) -> str:
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".vcf", ".vcard"):
+        return "vcard"
+    raise ValueError(f"Unsupported file format {extension}")
+
+
+def import_file(filename: str, book) -> ImportReport:
+    """Import contacts from .csv or .vcf file into the book."""
+    kind = file_format(filename)
+    # utf-8-sig прибирає BOM, який додає Excel
+    with open(filename, "r", encoding="utf-8-sig", newline="") as file:
+        rows = read_csv(file) if kind == "csv" else read_vcard(file)
+        return import_rows(rows, book)
+
+
+def write_csv(records, file) -> int:
+    writer = csv.writer(file)
+    writer.writerow(CSV_FIELDS)
+    count = 0
+    for record in records:
+        fields = record.to_dict()
+        address = fields["address"]
+        writer.writerow([record.name.value, ";".join(fields["phones"]), fields["birthday"],
+                         address["street"], address["city"], address["country"],
+                         address["postcode"], fields["email"]])
+        count += 1
+    return count
+
+
+def write_vcard(records, file) -> int:
+    count = 0
+    for record in records:
+        fields = record.to_dict()
+        address = fields["address"]
+        name = vcard_escape(record.name.value)
+        lines = ["BEGIN:VCARD", "VERSION:3.0", f"FN:{name}", f"N:;{name};;;"]
+        lines.extend(f"TEL:{phone}" for phone in fields["phones"])
+        if fields["birthday"]:
+            birthday = datetime.strptime(fields["birthday"], "%d.%m.%Y")
+            lines.append(f"BDAY:{birthday:%Y-%m-%d}")
+        if any(address.values()):
+            parts = ["", "", address["street"], address["city"], "",
+                     address["postcode"], address["country"]]
+            lines.append("ADR:" + ";".join(vcard_escape(part) for part in parts))
+        if fields["email"]:
+            lines.append(f"EMAIL:{fields['email']}")
+        lines.append("END:VCARD")
+        file.write("\r\n".join(lines) + "\r\n")
+        count += 1
+    return count
+
+
+def export_file(filename: str, book) -> int:
+    """Write all contacts of the book to .csv or .vcf file.
+    Return the number of exported contacts."""
+    kind = file_format(filename)
+    with open(filename, "w", encoding="utf-8", newline="") as file:
+        if kind == "csv":
+            return write_csv(book.data.values(), file)
+        return write_vcard(book.data.values(), file)
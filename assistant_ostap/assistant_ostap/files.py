@@ -0,0 +1,88 @@
+from contextlib import contextmanager
+import os
+import threading
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+
+def fsync_folder(folder):
+    # Після перейменування запис у теці теж треба скинути на диск.
+    # Windows не дозволяє відкрити теку, там це робить сама os.replace
+    try:
+        fd = os.open(folder, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def atomic_write(filename, mode="w", **kwargs):
+    """Open a temporary file next to filename for writing. When the block
+    ends without errors, the file is flushed to disk and replaces filename,
+    so after a crash filename holds either the old or the new data."""
+    tmp_filename = filename + ".tmp"
+    try:
+        with open(tmp_filename, mode, **kwargs) as file:
+            yield file
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        # Недописаний файл (помилка або Ctrl-C) лише прибирається
+        try:
+            os.remove(tmp_filename)
+        except OSError:
+            pass
+        raise
+    fsync_folder(os.path.dirname(os.path.abspath(filename)))
+
+
+# Файли, заблоковані поточним потоком
+_held = threading.local()
+
+
+@contextmanager
+def locked(filename):
+    """Hold an exclusive lock of filename + '.lock' while the block runs.
+    The lock is advisory: other Ostap processes wait for it, but programs
+    that don't take it are not stopped. Nested blocks of the same thread
+    reuse the lock that is already held."""
+    # Процес, створений через fork, успадковує цю множину, але не блокування
+    key = os.getpid(), os.path.abspath(filename)
+    held = _held.__dict__.setdefault("files", set())
+    if key in held:
+        yield
+        return
+    held.add(key)
+    try:
+        with _lock_file(filename):
+            yield
+    finally:
+        held.discard(key)
+
+
+@contextmanager
+def _lock_file(filename):
+    with open(filename + ".lock", "a+b") as file:
+        if os.name == "nt":
+            # LK_LOCK чекає на блокування до 10 секунд, потім кидає OSError
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == "nt":
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
@@ -1,15 +1,28 @@
+from calendar import month_name
 import os
 import platform
 import sys
-from rich.console import Console
-from rich.table import Table
 import assistant_ostap.assistant_ostap.classes as classes
-from assistant_ostap.assistant_ostap.notes import NoteBook
-from assistant_ostap.assistant_ostap.clean import main
+from assistant_ostap.assistant_ostap.paging import PageView
+from assistant_ostap.assistant_ostap.prompts import ask, is_interactive
+from assistant_ostap.assistant_ostap.storage import Session, open_storage
 import re
 
 
+# Модулі, потрібні лише окремим командам (rich, clean, columnar, exchange),
+# імпортуються всередині цих команд, щоб не сповільнювати запуск програми
+
 commands = {}
+# Дерево команд за словами, наприклад {"show": {"all": {None: "show all"}}}.
+# Ключ None у вузлі означає, що слова на шляху до нього утворюють команду
+command_tree = {}
+
+# Сесії тримають завантажені адресну книгу та нотатки між командами, тож
+# хендлери не перечитують data.json та notebook.json при кожному виклику.
+# Сховище можна змінити при запуску (див. main)
+_book_backend, _notes_backend = open_storage("json")
+session = Session(_book_backend)
+notes_session = Session(_notes_backend)
 
 # Декоратор set_commands створений для наповнення словника commands
 # Ключами є команда, котра передається у якості аргумента name та, за потреби,
@@ -18,9 +31,12 @@ commands = {}
 
 def set_commands(name, *additional):
     def inner(func):
-        commands[name] = func
-        for command in additional:
+        for command in (name, *additional):
             commands[command] = func
+            node = command_tree
+            for word in command.split():
+                node = node.setdefault(word, {})
+            node[None] = command
     return inner
 
 
@@ -55,6 +71,9 @@ def help_command(*args):
     # command це ключі в словнику commands.
     # func - значення. func.__doc__ це рядок документації, що додатково
     # прив'язувався до функції у декораторі input_error
+    from rich.console import Console
+    from rich.table import Table
+
     table = Table(title="Commands",style="magenta",show_lines=True)
     table.add_column('Comand')
     table.add_column('Description')
@@ -69,7 +88,7 @@ def help_command(*args):
 def add(*args):
     """Take as input username, phone number, birthday, address, email and add them to the base.
     If username already exist add phone number to this user."""
-    name = input('Enter name:')
+    name = ask('name', 'Enter name:')
     if classes.Name.is_valid_name(name):
         name = classes.Name(name)
     else:
@@ -77,14 +96,14 @@ def add(*args):
     # Два блоки if, розміщених нижче відповідають за правильність введення телефону
     # та дня народження. Якщо значення невалідне, викликається помилка, що потім обробляється
     # деораторот input_error
-    phone_number = input('Enter phone number:') 
+    phone_number = ask('phone', 'Enter phone number:') 
     if classes.Phone.is_valid_phone(phone_number):
         phone_number = classes.Phone(phone_number)
     else:
         raise classes.WrongPhone
     # У змінній data зберігається екземпляр класу AddressBook із записаними раніше контактами
     # Змінна name_exists показує, чи існує контакт з таким ім'ям у data
-    data = classes.AddressBook.open_file("data.json")
+    data = session.data
     name_exists = bool(data.get(name.value))
 
     # Тут відбувається перевірка, чи ім'я вже є у списку контактів
@@ -95,19 +114,22 @@ def add(*args):
         # Дані повідомлення записуються у змінну та повертаються з функції
         # для показу користувачу
         msg = data[name.value].add_phone(phone_number)
+        # Книга живе у сесії між командами, тому зміну потрібно зберегти,
+        # інакше файл і пам'ять розійдуться
+        session.save()
         return msg
-    birthday = input('Enter birthday:')
+    birthday = ask('birthday', 'Enter birthday:')
     if classes.Birthday.is_valid_date(birthday):
         birthday = classes.Birthday(birthday)
     else:
         raise classes.WrongDate
-    street = input('Enter street:')
-    city = input('Enter city:')
-    country = input('Enter country:')
-    postcode = input('Enter postcode:')
+    street = ask('street', 'Enter street:')
+    city = ask('city', 'Enter city:')
+    country = ask('country', 'Enter country:')
+    postcode = ask('postcode', 'Enter postcode:')
     address = classes.Address(street, city, country, postcode)
 
-    email_value = input('Enter email:')
+    email_value = ask('email', 'Enter email:')
     if not classes.Email.is_valid_email(email_value):
         raise classes.WrongEmail
 
@@ -115,23 +137,66 @@ def add(*args):
 
     record = classes.Record(name, [phone_number], birthday, address, email)
     data.add_record(record)
-    data.write_to_file("data.json")
+    session.save()
     return f"User {name} added successfully."
 
     
+@set_commands("import")
+@input_error
+def import_contacts(*args):
+    """Take as input path to .csv or .vcf file and add its contacts to the base.
+    Phones and missing data of existing users are added to them."""
+    from assistant_ostap.assistant_ostap.exchange import file_format, import_file
+
+    filename = ask('file', 'Enter path to .csv or .vcf file:')
+    # Непідтримуване розширення - це не брак аргументів, тож ValueError
+    # не передається до input_error
+    try:
+        file_format(filename)
+    except ValueError as error:
+        return str(error)
+    # Книга (і журнал змін) записується один раз після імпорту всього файлу
+    with session.deferred():
+        data = session.data
+        try:
+            report = import_file(filename, data)
+        except OSError:
+            return f"Can't read file {filename}"
+        session.save()
+    return str(report)
+
+
+@set_commands("export")
+@input_error
+def export_contacts(*args):
+    """Take as input path to .csv or .vcf file and write all contacts to it."""
+    from assistant_ostap.assistant_ostap.exchange import export_file, file_format
+
+    filename = ask('file', 'Enter path to .csv or .vcf file:')
+    try:
+        file_format(filename)
+    except ValueError as error:
+        return str(error)
+    try:
+        count = export_file(filename, session.data)
+    except OSError:
+        return f"Can't write file {filename}"
+    return f"Exported {count} contacts to {filename}."
+
+
 @set_commands("add phone")
 @input_error
 def add_phone(*args):
     """Takes as input username, phone number and adds to the contact."""
 
-    name = classes.Name(input('Enter name:'))
-    phone = input('Enter phone:')
+    name = classes.Name(ask('name', 'Enter name:'))
+    phone = ask('phone', 'Enter phone:')
     if classes.Phone.is_valid_phone(phone):
         new_phone = classes.Phone(phone)
     else:
         raise classes.WrongPhone
 
-    data = classes.AddressBook.open_file("data.json")
+    data = session.data
     name_exists = bool(data.get(name.value))
     if not name_exists:
         msg = f"Name {name} doesn't exist. "\
@@ -139,7 +204,7 @@ def add_phone(*args):
     else:
         msg = data[name.value].add_phone(new_phone)
 
-    data.write_to_file("data.json")
+    session.save()
     return msg
 
 
@@ -150,11 +215,11 @@ def create_note(*args):
     text = " ".join(args)
     if not text.strip():
         return "Please enter the text of the note"
-    nb = NoteBook.read_from_file()
-    nb.add_note(text)
+    nb = notes_session.data
+    note_id = nb.add_note(text)
 
-    nb.save_to_file()
-    return "Note added successfully."
+    notes_session.save()
+    return f"Note {note_id} added successfully."
 
      
 @set_commands("change phone")
@@ -163,15 +228,15 @@ def change(*args):
     """Take as input username, old and new phone number 
     and changes the corresponding data."""
 
-    name = classes.Name(input('Enter name:'))
-    old_phone = classes.Phone(input('Enter old phone:'))
-    new_phone = input('Enter new phone:')
+    name = classes.Name(ask('name', 'Enter name:'))
+    old_phone = classes.Phone(ask('old_phone', 'Enter old phone:'))
+    new_phone = ask('new_phone', 'Enter new phone:')
     if classes.Phone.is_valid_phone(new_phone):
         new_phone = classes.Phone(new_phone)
     else:
         raise classes.WrongPhone
 
-    data = classes.AddressBook.open_file("data.json")
+    data = session.data
     name_exists = bool(data.get(name.value))
 
     if not name_exists:
@@ -180,7 +245,7 @@ def change(*args):
     else:
         msg = data[name.value].change_phone(old_phone, new_phone)
 
-    data.write_to_file("data.json")
+    session.save()
     return msg
 
 
@@ -190,15 +255,15 @@ def change_birthday(*args):
     """Takes as input username, birthday date
     and changes the corresponding data."""
 
-    name = classes.Name(input('Enter name:'))
-    birthday = input('Enter b-day:')
+    name = classes.Name(ask('name', 'Enter name:'))
+    birthday = ask('birthday', 'Enter b-day:')
     if classes.Birthday.is_valid_date(birthday):
         new_birthday = classes.Birthday(birthday)
     else:
         raise classes.WrongDate(
                 "Invalid date. Please enter birthday in format 'DD.MM.YYYY'.")
 
-    data = classes.AddressBook.open_file("data.json")
+    data = session.data
     name_exists = bool(data.get(name.value))
     if not name_exists:
         msg = f"Name {name} doesn`t exist. "\
@@ -206,7 +271,7 @@ def change_birthday(*args):
     else:
         msg = data[name.value].change_birthday(new_birthday)
 
-    data.write_to_file("data.json")
+    session.save()
     return msg
 
 
@@ -214,12 +279,12 @@ def change_birthday(*args):
 @input_error
 def change_address(*args):
     """Takes as input username, new address and changes the corresponding data."""
-    name = classes.Name(input('Enter name:'))
-    street = input('Enter street:')
-    city = input('Enter city:')
-    country = input('Enter country:')
-    postcode = input('Enter postcode:')
-    data = classes.AddressBook.open_file("data.json")
+    name = classes.Name(ask('name', 'Enter name:'))
+    street = ask('street', 'Enter street:')
+    city = ask('city', 'Enter city:')
+    country = ask('country', 'Enter country:')
+    postcode = ask('postcode', 'Enter postcode:')
+    data = session.data
     name_exists = bool(data.get(name.value))
     if not name_exists:
         msg = f"Name {name} doesn't exist. "\
@@ -229,7 +294,7 @@ def change_address(*args):
                               country, postcode)
         msg = data[name.value].change_address(address)
 
-    data.write_to_file("data.json")
+    session.save()
     return msg
 
 
@@ -238,20 +303,20 @@ def change_address(*args):
 def change_email(*args):
     """Takes as input username, new email and changes the corresponding data."""
 
-    name = classes.Name(input('Enter name:'))
-    data = classes.AddressBook.open_file("data.json")
+    name = classes.Name(ask('name', 'Enter name:'))
+    data = session.data
     name_exists = bool(data.get(name.value))
     if not name_exists:
         msg = f"Name {name} doesn't exist. "\
             "If you want to add it, please use add command."
     else:
-        email_value = input('Enter email:')
+        email_value = ask('email', 'Enter email:')
         if not classes.Email.is_valid_email(email_value):
             raise classes.WrongEmail
         new_email = classes.Email(email_value)
         msg = data[name.value].change_email(new_email)
 
-    data.write_to_file("data.json")
+    session.save()
     return msg
 
 
@@ -259,11 +324,11 @@ def change_email(*args):
 @input_error
 def edit_note(*args):
     """Take as input note id and change selected note"""
-    note_id = input('Enter note ID:')
-    nb = NoteBook.read_from_file()
+    note_id = ask('id', 'Enter note ID:')
+    nb = notes_session.data
     nb.edit_note(note_id)
 
-    nb.save_to_file()
+    notes_session.save()
     return "Note edited successfully."
 
 
@@ -271,9 +336,9 @@ def edit_note(*args):
 @input_error
 def delete_user(*args):
     """Take as input username and delete that user"""
-    name = classes.Name(input('Enter name:'))
+    name = classes.Name(ask('name', 'Enter name:'))
 
-    data = classes.AddressBook.open_file("data.json")
+    data = session.data
     name_exists = bool(data.get(name.value))
 
     if not name_exists:
@@ -281,7 +346,7 @@ def delete_user(*args):
     else:
         data.delete_record(name)
 
-    data.write_to_file("data.json")
+    session.save()
     return f"User {name} deleted successfully."
 
 
@@ -289,10 +354,10 @@ def delete_user(*args):
 @input_error
 def delete_phone(*args):
     """Takes as input username and phone number and deletes that phone"""
-    name = classes.Name(input('Enter name:'))
-    phone = classes.Phone(input('Enter phone:'))
+    name = classes.Name(ask('name', 'Enter name:'))
+    phone = classes.Phone(ask('phone', 'Enter phone:'))
 
-    data = classes.AddressBook.open_file("data.json")
+    data = session.data
     name_exists = bool(data.get(name.value))
 
     if not name_exists:
@@ -300,7 +365,7 @@ def delete_phone(*args):
     else:
         msg = data[name.value].delete_phone(phone)
 
-    data.write_to_file("data.json")
+    session.save()
     return msg
 
 
@@ -308,10 +373,10 @@ def delete_phone(*args):
 @input_error
 def del_note(*args):
     """Take as input note id and delete selected note"""
-    note_id = input('Enter note ID:')
-    nb = NoteBook.read_from_file()
+    note_id = ask('id', 'Enter note ID:')
+    nb = notes_session.data
     nb.del_note(note_id)
-    nb.save_to_file()
+    notes_session.save()
     return "Note deleted successfully."   
 
 
@@ -319,23 +384,26 @@ def del_note(*args):
 @input_error
 def show_all(*args):
     """Show all users or notes"""
-    field = input('Enter type of fields (users or notes):').lower()
-    # Код функції show_all має саме такий вигляд тому, що AddressBook
-    # це ітератор
+    field = ask('field', 'Enter type of fields (users or notes):').lower()
+    # Повертається PageView, а сторінки показує main
     if field not in ("users", "notes"):
         return f"Unknown field {field}. Please type 'users' or 'notes'"
-    if field == "users":
-        return classes.AddressBook.open_file("data.json")
-    return NoteBook.read_from_file()
+    if field == "notes":
+        return PageView(notes_session.data)
+    order = ask('order', 'Enter order of users (name, birthday or '
+                'press Enter to keep the order of adding):').strip().lower()
+    if order not in ("", "name", "birthday"):
+        return f"Unknown order {order}. Please type 'name' or 'birthday'"
+    return PageView(session.data, order=order or None)
 
 
 @set_commands("show phone")
 @input_error
 def phone(*args):
     """Take as input username and show user`s phone number."""
-    name = classes.Name(input('Enter name:'))
+    name = classes.Name(ask('name', 'Enter name:'))
 
-    data = classes.AddressBook.open_file("data.json")
+    data = session.data
     name_exists = bool(data.get(name.value))
 
     if not name_exists:
@@ -356,9 +424,9 @@ def phone(*args):
 @input_error
 def address(*args):
     """Take the input username and show the address"""
-    name = classes.Name(input('Enter name:'))
+    name = classes.Name(ask('name', 'Enter name:'))
 
-    data = classes.AddressBook.open_file("data.json")
+    data = session.data
     name_exists = bool(data.get(name.value))
 
     if not name_exists:
@@ -377,8 +445,8 @@ def address(*args):
 @input_error
 def email(*args):
     """Take the input username and show the email"""
-    name = classes.Name(input('Enter name:'))
-    data = classes.AddressBook.open_file("data.json")
+    name = classes.Name(ask('name', 'Enter name:'))
+    data = session.data
     name_exists = bool(data.get(name.value))
 
     if not name_exists:
@@ -400,38 +468,71 @@ def show_birthdays_handler(*args):
     """Take as input number of days and show the list of birthdays.
     The MAX number of days is 365"""
     try:
-        value = int(input('Enter count of days:'))
+        value = int(ask('days', 'Enter count of days:'))
     except IndexError:
         return "Please enter the valid command: showbd number_of_days"
     if type(value) == int and value > 0:
-        data = classes.AddressBook.open_file("data.json")
+        data = session.data
         if value > 365:
             value = 365
-        return data.show_birthday(value)
+        birthdays = data.show_birthday(value)
+        if not birthdays:
+            if value == 1:
+                return f"There are no birthdays to show within {value} day"
+            return f"There are no birthdays to show within {value} days"
+        return f"Birthdays today and within {value} next day(s):\n{birthdays}"
     else:
         return "Please input a valid number of days"
 
 
+@set_commands("show stats")
+@input_error
+def show_stats(*args):
+    """Take as input type of statistics (birthdays, cities, countries or phones)
+    and show how many contacts are in each group."""
+    from assistant_ostap.assistant_ostap.columnar import ColumnarView
+
+    kind = ask('kind', 'Enter type of statistics (birthdays/cities/countries/phones):').lower()
+    if kind not in ("birthdays", "cities", "countries", "phones"):
+        return f"Unknown type '{kind}'.\nTo see more info enter 'help'"
+    # Колонковий вигляд будується один раз і перебудовується лише
+    # після змін у книзі
+    view = ColumnarView.of(session.data)
+    if kind == "birthdays":
+        by_month = view.birthdays_by_month()
+        rows = [(month_name[month], by_month[month]) for month in sorted(by_month)]
+    elif kind == "cities":
+        rows = view.count_cities().most_common()
+    elif kind == "countries":
+        rows = view.count_countries().most_common()
+    else:
+        length = int(ask('length', 'Enter length of phone prefix:') or 3)
+        rows = view.count_phone_prefixes(length).most_common()
+    if not rows:
+        return "There is no data to show"
+    return "\n".join(f"{key}: {number}" for key, number in rows)
+
+
 @set_commands("search")
 @input_error
 def search_handler(*args):
-    """Take as input searched field(name, phone, tag or text)
-    and the text to be found. Returns all found users"""
+    """Take as input searched field(name, phone, email, tag or text)
+    and the text to be found. Returns all found users or notes.
+    Tags separated by spaces must all be present, separated by '|' - any of them."""
     # у даній функції користувачу потрібно обрати, у яких полях
     # відбуватиметься пошук(наразі це name або phone) та ввести значення для пошуку.
     #  Функція повертає рядок з переліком усіх контаків
-    field = input('Enter type of field to search by (name/phone/email/tag/text):')
-    text = input('Enter value of field:')
+    field = ask('field', 'Enter type of field to search by (name/phone/email/tag/text):')
+    text = ask('value', 'Enter value of field:')
     if field.lower() not in ("name", "phone", "email","tag","text"):
         return f"Unknown field '{field}'.\nTo see more info enter 'help'"
 
-    nb = NoteBook.read_from_file()
     if field == "text":
-        return nb.find_notes_by_text(text)
+        return notes_session.data.find_notes_by_text(text)
     elif field == "tag":
-        return nb.find_notes_by_keyword(text)
+        return notes_session.data.find_notes_by_keyword(text)
 
-    ab = classes.AddressBook.open_file("data.json")
+    ab = session.data
     result = ab.search(field, text)
     if not result:
         return "There are no users matching"
@@ -441,9 +542,10 @@ def search_handler(*args):
 @set_commands("sort notes")
 @input_error
 def sort_notes(*args):
-    """Takes a keyword as input and sorts notes by it"""
-    keyword = input('Enter tag what will be used for sorting notes:')
-    nb = NoteBook.read_from_file()
+    """Takes tags, 'frequency' or 'created' as input and sorts notes by them"""
+    keyword = ask('tag', "Enter tags to sort notes by, 'frequency' to sort by "
+                  "frequency of tags or press Enter to sort by creation:")
+    nb = notes_session.data
     return nb.sort_notes(keyword)
 
 
@@ -451,6 +553,8 @@ def sort_notes(*args):
 @input_error
 def sort_files(*args):
     """Sort files by categories in input directory"""
+    from assistant_ostap.assistant_ostap.clean import main
+
     return main()
 
 
@@ -460,6 +564,9 @@ def clear(*args):
     """Clear the console."""
     # Дана функція відповідальна за очищення консолі.
     # Darwin це macOS
+    # У пакетному режимі вивід - це JSON рядки, тож екран не очищується
+    if not is_interactive():
+        return None
     system = platform.system()
     if system == "Windows":
         os.system("cls")
@@ -473,6 +580,9 @@ def clear(*args):
 @input_error
 def exit(*args):
     """Interrupt program."""
+    # Згруповані збереження записуються одразу, а не після затримки
+    session.flush()
+    notes_session.flush()
     sys.exit(0)
 
 # Для того, щоб дадати нові команди до бота достатньо просто
@@ -1,27 +1,38 @@
-from collections import UserDict
+from bisect import bisect_left, insort
+from collections import UserDict, defaultdict
 from dataclasses import dataclass, asdict
+from itertools import count
 import json
-import random
 import re
+import sys
 
-import readline
+from assistant_ostap.assistant_ostap.files import atomic_write
+from assistant_ostap.assistant_ostap.paging import PageView
+from assistant_ostap.assistant_ostap.prompts import ask, is_interactive
 
 
-@dataclass
+# Ключовим вважається слово, перед яким у тексті є знак "#"
+TAG_PATTERN = re.compile(r"#(\w+)")
+WORD_PATTERN = re.compile(r"\w+")
+# Ключ notebook.json зі службовими даними, а не з нотаткою
+META_KEY = "__meta__"
+
+
+# slots зменшують пам'ять, яку займає кожна нотатка.
+# Параметр slots у dataclass з'явився лише у Python 3.10
+@dataclass(**({"slots": True} if sys.version_info >= (3, 10) else {}))
 class Note:
     text: str
     id: str
     tags: list = list
 
     def __post_init__(self):
-        self.tags = self.keywords
+        # Теги обчислюються один раз при створенні нотатки
+        self.tags = TAG_PATTERN.findall(self.text.lower())
 
     @property
     def keywords(self) -> list:
-        # Ключовим вважається слово, перед яким у тексті є знак "#"
-        pattern = r"#(\w+)"
-        tags = re.findall(pattern, self.text.lower())
-        return tags
+        return self.tags
 
     def __str__(self):
         return f"{self.id}: {self.text}"
@@ -30,7 +41,224 @@ class Note:
         return str(self)
 
 
+def parse_tags(keyword: str) -> list:
+    """Split keyword like "#work, home" to tags without repeats."""
+    return list(dict.fromkeys(tag.lstrip("#").lower()
+                              for tag in re.split(r"[|,\s]+", keyword) if tag))
+
+
+class NoteIndex:
+    """Tag index and inverted index of words for NoteBook."""
+
+    def __init__(self):
+        self.tags = defaultdict(set)
+        self.words = defaultdict(set)
+        # Відсортовані слова та слова задом наперед потрібні для пошуку
+        # слів, що починаються або закінчуються на заданий фрагмент
+        self.prefixes = []
+        self.suffixes = []
+        # Трійки літер слів, щоб знаходити слова, які містять фрагмент
+        # усередині, без перегляду всіх слів
+        self.trigrams = defaultdict(set)
+        self.indexed = {}
+        self.order = {}
+        self.counter = count()
+        # Порядки нотаток для sort notes. Вони обчислюються один раз
+        # і скидаються при будь-якій зміні нотаток
+        self.sorted = {}
+
+    @classmethod
+    def build(cls, notes):
+        """Return index of all notes. Sorted words are built once at the end."""
+        index = cls()
+        for note in notes:
+            index.add(note, bulk=True)
+        index.prefixes = sorted(index.words)
+        index.suffixes = sorted(word[::-1] for word in index.words)
+        for word in index.words:
+            index._add_trigrams(word)
+        return index
+
+    @staticmethod
+    def _grams(word: str) -> set:
+        return {word[i:i + 3] for i in range(len(word) - 2)}
+
+    def _add_trigrams(self, word):
+        for gram in self._grams(word):
+            self.trigrams[gram].add(word)
+
+    def _remove_trigrams(self, word):
+        for gram in self._grams(word):
+            self.trigrams[gram].discard(word)
+            if not self.trigrams[gram]:
+                del self.trigrams[gram]
+
+    def add(self, note: Note, bulk=False):
+        self.remove(note.id, keep_order=True)
+        self.sorted.clear()
+        tags = set(note.tags)
+        words = set(WORD_PATTERN.findall(note.text))
+        for tag in tags:
+            self.tags[tag].add(note.id)
+        for word in words:
+            if word not in self.words and not bulk:
+                insort(self.prefixes, word)
+                insort(self.suffixes, word[::-1])
+                self._add_trigrams(word)
+            self.words[word].add(note.id)
+        self.indexed[note.id] = tags, words
+        if note.id not in self.order:
+            self.order[note.id] = next(self.counter)
+
+    def remove(self, note_id, keep_order=False):
+        if note_id not in self.indexed:
+            return
+        self.sorted.clear()
+        tags, words = self.indexed.pop(note_id)
+        for tag in tags:
+            self.tags[tag].discard(note_id)
+            if not self.tags[tag]:
+                del self.tags[tag]
+        for word in words:
+            self.words[word].discard(note_id)
+            if not self.words[word]:
+                del self.words[word]
+                del self.prefixes[bisect_left(self.prefixes, word)]
+                del self.suffixes[bisect_left(self.suffixes, word[::-1])]
+                self._remove_trigrams(word)
+        if not keep_order:
+            del self.order[note_id]
+
+    @staticmethod
+    def _starting_with(words: list, prefix: str):
+        for position in range(bisect_left(words, prefix), len(words)):
+            if not words[position].startswith(prefix):
+                break
+            yield words[position]
+
+    def find_tags(self, tags: list, match_all=True) -> list:
+        postings = [self.tags.get(tag, set()) for tag in tags]
+        if not postings:
+            return []
+        if match_all:
+            ids = set.intersection(*postings)
+        else:
+            ids = set.union(*postings)
+        return sorted(ids, key=self.order.__getitem__)
+
+    def _containing(self, part: str):
+        """Yield words of notes which contain part."""
+        grams = self._grams(part)
+        if not grams:
+            # У фрагменті з одного-двох символів немає трійок
+            return (word for word in self.prefixes if part in word)
+        postings = sorted((self.trigrams.get(gram, set()) for gram in grams), key=len)
+        return (word for word in postings[0].intersection(*postings[1:]) if part in word)
+
+    def find_text(self, text: str):
+        """Return ids of notes which may contain text.
+        The caller still has to check them with 'in'."""
+        candidates = None
+        # Слово з середини фрази має бути окремим словом нотатки. Перше слово
+        # фрази може бути закінченням слова нотатки, останнє - його початком,
+        # а якщо фраза - це одне слово, то воно може бути будь-якою його частиною
+        matches = sorted(WORD_PATTERN.finditer(text),
+                         key=lambda match: (match.start() == 0) + (match.end() == len(text)))
+        if not matches:
+            return self.indexed.keys()
+        for match in matches:
+            word = match.group()
+            at_start, at_end = match.start() == 0, match.end() == len(text)
+            if not at_start and not at_end:
+                words = [word]
+            elif at_end and not at_start:
+                words = self._starting_with(self.prefixes, word)
+            elif at_start and not at_end:
+                words = (suffix[::-1] for suffix in self._starting_with(self.suffixes, word[::-1]))
+            else:
+                words = self._containing(word)
+            ids = set()
+            for candidate in words:
+                ids.update(self.words.get(candidate, ()))
+            candidates = ids if candidates is None else candidates & ids
+            if not candidates:
+                break
+        return candidates
+
+    def ordered(self, ids) -> list:
+        return sorted(ids, key=self.order.__getitem__)
+
+    @staticmethod
+    def _joined(buckets) -> list:
+        return [note_id for key in sorted(buckets) for note_id in buckets[key]]
+
+    def by_tags(self, tags: list) -> list:
+        """Return ids of notes with the first tag first, among them with the
+        second tag first and so on. Other notes keep the order of creation."""
+        key = ("tags", tuple(tags))
+        if key not in self.sorted:
+            postings = [self.tags.get(tag, ()) for tag in tags]
+            # Кошики замість сортування: ключ нотатки - біти відсутніх тегів,
+            # старший біт відповідає першому тегу
+            buckets = defaultdict(list)
+            for note_id in self.order:
+                mask = 0
+                for ids in postings:
+                    mask = mask << 1 | (note_id not in ids)
+                buckets[mask].append(note_id)
+            self.sorted[key] = self._joined(buckets)
+        return self.sorted[key]
+
+    def by_frequency(self) -> list:
+        """Return ids of notes grouped by their most frequent tag, the most
+        frequent tags first. Notes without tags are the last."""
+        key = ("frequency",)
+        if key not in self.sorted:
+            rank = {tag: position for position, tag in enumerate(
+                sorted(self.tags, key=lambda tag: (-len(self.tags[tag]), tag)))}
+            buckets = defaultdict(list)
+            for note_id in self.order:
+                tags = self.indexed[note_id][0]
+                buckets[min((rank[tag] for tag in tags), default=len(rank))].append(note_id)
+            self.sorted[key] = self._joined(buckets)
+        return self.sorted[key]
+
+
 class NoteBook(UserDict):
+    def __init__(self, *args, **kwargs):
+        # Індекс будується при читанні з файлу (read_from_file) або при першому
+        # пошуку і далі оновлюється при додаванні, зміні та видаленні нотаток
+        self._index = None
+        # Номер наступної нотатки. Номери лише зростають і не використовуються
+        # повторно після видалення нотатки. None - ще не відомий
+        self.next_id = None
+        # listeners викликаються при кожній зміні: (операція, номер, *аргументи)
+        self.listeners = []
+        super().__init__(*args, **kwargs)
+
+    def __setitem__(self, note_id, note):
+        operation = "put" if note_id in self.data else "add"
+        self.data[note_id] = note
+        if self._index is not None:
+            self._index.add(note)
+        self._changed(operation, note_id, note)
+
+    def __delitem__(self, note_id):
+        del self.data[note_id]
+        if self._index is not None:
+            self._index.remove(note_id)
+        self._changed("delete", note_id)
+
+    def _changed(self, operation, note_id, *args):
+        for listener in self.listeners:
+            listener(operation, note_id, *args)
+
+    @property
+    def index(self) -> NoteIndex:
+        if self._index is None:
+            self._index = NoteIndex.build(self.data.values())
+        return self._index
+
     def __add__(self, other):
         if isinstance(other, NoteBook):
             new_notebook = NoteBook()
@@ -40,98 +268,122 @@ class NoteBook(UserDict):
         else:
             raise TypeError("Can only add two NoteBook instances together")
 
-    def add_note(self, text: str):
-        note_id = str(random.randint(1000, 9999))
+    def allocate_id(self) -> str:
+        if self.next_id is None:
+            # Книга без збереженого лічильника (наприклад, файл старої версії)
+            self.next_id = max((int(note_id) for note_id in self.data
+                                if note_id.isdecimal()), default=0) + 1
+        # Номер міг бути зайнятий, якщо файл змінювали вручну
+        while str(self.next_id) in self.data:
+            self.next_id += 1
+        note_id = str(self.next_id)
+        self.next_id += 1
+        return note_id
+
+    def add_note(self, text: str) -> str:
+        """Add note and return its id."""
+        note_id = self.allocate_id()
         note = Note(text, note_id)
-        self.data[note_id] = note
+        self[note_id] = note
+        return note_id
 
     def edit_note(self, note_id):
-        def set_initial_input(text):
-            def hook():
-                readline.insert_text(text)
-                readline.redisplay()
-            readline.set_pre_input_hook(hook)
-
-        set_initial_input(self.data[note_id].text)
-        user_input = input('Enter new text for note:')
+        # KeyError, якщо нотатки немає, і в консолі, і в пакетному режимі
+        old_text = self.data[note_id].text
+        # Підставляти старий текст для редагування є сенс лише у консолі,
+        # тож лише тоді завантажується readline
+        interactive = is_interactive()
+        if interactive:
+            import readline
+
+            def set_initial_input(text):
+                def hook():
+                    readline.insert_text(text)
+                    readline.redisplay()
+                readline.set_pre_input_hook(hook)
+
+            set_initial_input(old_text)
+        user_input = ask('text', 'Enter new text for note:')
         new_note = Note(user_input, id=note_id)
-        self.data[note_id] = new_note
-        set_initial_input("")
+        self[note_id] = new_note
+        if interactive:
+            set_initial_input("")
 
     def del_note(self, note_id):
         del self[note_id]
 
     def find_notes_by_keyword(self, keyword):
-        result = []
-        for note in self.data.values():
-            if keyword in note.tags:
-                result.append(str(note))
+        # Декілька тегів через пробіл чи кому - потрібні усі з них,
+        # через "|" - хоча б один
+        match_all = "|" not in keyword
+        tags = parse_tags(keyword)
+        # Сховище (наприклад, SQLite) може мати власний індексований пошук
+        if hasattr(self.data, "find_by_tags"):
+            notes = self.data.find_by_tags(tags, match_all)
+        else:
+            notes = (self.data[note_id]
+                     for note_id in self.index.find_tags(tags, match_all))
+        result = [str(note) for note in notes]
         if not result:
             return "There are no notes matching"
         return "\n".join(result)
 
     def find_notes_by_text(self, text):
-        result = []
-        for note in self.data.values():
-            if text in note.text:
-                result.append(str(note))
+        if hasattr(self.data, "find_by_text"):
+            result = [str(note) for note in self.data.find_by_text(text)]
+        else:
+            candidates = self.index.ordered(self.index.find_text(text))
+            result = [str(self.data[note_id]) for note_id in candidates
+                      if text in self.data[note_id].text]
         if not result:
             return "There are no notes matching"
         return "\n".join(result)
 
-    def sort_notes(self, keyword):
-        notes_with_keyword = NoteBook()
-        notes_without_keyword = NoteBook()
-        nb = NoteBook.read_from_file()
-
-        for note in nb.data.values():
-            if keyword.lower() in note.tags:
-                notes_with_keyword[note.id] = note
-            else:
-                notes_without_keyword[note.id] = note
+    def ordered(self, order: str):
+        """Return ids of notes in the order of sort notes: "created",
+        "frequency" or tags separated by spaces or commas."""
+        if order == "created":
+            return self.data
+        if order == "frequency":
+            return self.index.by_frequency()
+        return self.index.by_tags(parse_tags(order))
 
-        if not notes_with_keyword:
+    def sort_notes(self, keyword):
+        """Return PageView of notes sorted by tags of keyword, by frequency
+        of tags or by creation. Notes are not copied."""
+        order = keyword.strip().lower() or "created"
+        if order not in ("created", "frequency") \
+                and not any(tag in self.index.tags for tag in parse_tags(order)):
             return f"Keyword {keyword} not found"
+        return PageView(self, order=order)
 
-        return notes_with_keyword + notes_without_keyword
-
-    def save_to_file(self):
+    def save_to_file(self, filename="notebook.json"):
         result = {}
         for note_id, note in self.data.items():
             result[str(note_id)] = asdict(note)
+        if self.next_id is not None:
+            result[META_KEY] = {"next_id": self.next_id}
 
-        with open("notebook.json", "w") as file:
+        with atomic_write(filename) as file:
             json.dump(result, file, indent=4, ensure_ascii=False)
 
     @classmethod
-    def read_from_file(cls):
+    def read_from_file(cls, filename="notebook.json"):
         try:
-            with open("notebook.json") as file:
+            with open(filename) as file:
                 data_json = json.load(file)
                 data = cls()
+                data.next_id = data_json.pop(META_KEY, {}).get("next_id")
                 for note_json in data_json.values():
                     note = Note(**note_json)
                     data[note.id] = note
+                # Індекс будується одразу при читанні, тож перший пошук
+                # не чекає на нього
+                data._index = NoteIndex.build(data.data.values())
 
         except FileNotFoundError:
             data = cls()
         return data
 
     def __iter__(self):
-        self.current_page = 1
-        self.page_size = 10
-        self.start_index = (self.current_page - 1) * self.page_size
-        self.end_index = self.start_index + self.page_size
-        return self
-
-    def __next__(self):
-        if self.start_index >= len(self.data):
-            raise StopIteration
-
-        page_records = list(self.data.values())[
-            self.start_index:self.end_index]
-        self.start_index = self.end_index
-        self.end_index = self.start_index + self.page_size
-        self.current_page += 1
-
-        return page_records
+        return PageView(self)
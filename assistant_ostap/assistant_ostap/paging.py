@@ -0,0 +1,78 @@
+from collections.abc import Sequence
+from itertools import islice
+
+
+PAGE_SIZE = 10
+
+
+class PageView:
+    """Pages of records of AddressBook or notes of NoteBook.
+
+    Each view keeps its own position, so several views of the same book
+    don't interfere. Pages are numbered from 1. Showing the next page takes
+    O(page_size); jumping to page N is O(page_size) for sorted orders and
+    skips names without creating records for the order of adding."""
+
+    def __init__(self, book, page_size: int = PAGE_SIZE, order: str = None):
+        if page_size < 1:
+            raise ValueError("Page size must be positive")
+        self.book = book
+        self.page_size = page_size
+        # None - порядок додавання, інакше назва порядку для book.ordered
+        self.order = order
+        # Номер останньої показаної сторінки
+        self.page = 0
+        self._names = None
+        self._position = 0
+
+    def keys(self):
+        if self.order is None:
+            return self.book.data
+        return self.book.ordered(self.order)
+
+    @property
+    def pages(self) -> int:
+        return -(-len(self.book.data) // self.page_size)
+
+    @property
+    def known_pages(self):
+        """Return the number of pages or None if counting them would read
+        the whole storage (data.json with --lazy)."""
+        if not getattr(self.book.data, "scanned", True):
+            return None
+        return self.pages
+
+    def _take(self, start: int) -> list:
+        # Ітератор імен живе між сторінками, тож наступна сторінка
+        # продовжує з того місця, де закінчилась попередня
+        if self._names is None or self._position != start:
+            self._names = islice(self.keys(), start, None)
+        try:
+            names = list(islice(self._names, self.page_size))
+        except RuntimeError:
+            # Книга змінилася між сторінками, тож прохід починається заново
+            self._names = islice(self.keys(), start, None)
+            names = list(islice(self._names, self.page_size))
+        self._position = start + len(names)
+        return names
+
+    def get_page(self, number: int) -> list:
+        """Return records of the page number (empty list after the last page)."""
+        start = (number - 1) * self.page_size
+        keys = self.keys()
+        if isinstance(keys, Sequence):
+            names = keys[start:start + self.page_size]
+        else:
+            names = self._take(start)
+        self.page = number
+        data = self.book.data
+        return [data[name] for name in names]
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> list:
+        page = self.get_page(self.page + 1)
+        if not page:
+            raise StopIteration
+        return page
@@ -0,0 +1,31 @@
+from contextlib import contextmanager
+
+
+# Відповіді для команди, що виконується у пакетному режимі.
+# None означає, що аргументи запитуються у користувача
+_answers = None
+
+
+def ask(key: str, prompt: str) -> str:
+    """Return argument key of the current command. It is taken from the
+    batch answers if they are set, otherwise the user is asked with prompt."""
+    if _answers is None:
+        return input(prompt)
+    value = _answers.get(key)
+    # Пропущений аргумент рівнозначний порожньому вводу користувача
+    return "" if value is None else str(value)
+
+
+def is_interactive() -> bool:
+    return _answers is None
+
+
+@contextmanager
+def answering(answers: dict):
+    """Answer prompts from answers instead of asking the user."""
+    global _answers
+    previous, _answers = _answers, answers
+    try:
+        yield
+    finally:
+        _answers = previous
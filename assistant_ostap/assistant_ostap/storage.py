@@ -0,0 +1,970 @@
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+import codecs
+import json
+import os
+import re
+import sqlite3
+import threading
+import weakref
+
+from assistant_ostap.assistant_ostap.classes import (AddressBook, Address, Birthday,
+                                                     Email, Name, Phone, Record)
+from assistant_ostap.assistant_ostap.files import atomic_write, locked
+from assistant_ostap.assistant_ostap.notes import Note, NoteBook
+
+
+def file_stamp(filename):
+    # Час модифікації та розмір файлу. Якщо вони не змінились з моменту
+    # останнього читання/запису, то перечитувати файл немає потреби
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+NUMBER_START = "-0123456789"
+
+
+def scan_json_object(file, chunk_size=1 << 20):
+    """Read json object from binary file by chunks.
+    Yield (key, offset, length) in bytes of every value."""
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    text = ""
+    pos = 0
+    # Позиції у text - це символи, а у файлі - байти. mark та mark_offset
+    # зв'язують їх, щоб не перекодовувати увесь текст щоразу
+    mark = mark_offset = 0
+    expected = "{"
+    key = None
+    eof = False
+    while True:
+        pos = WHITESPACE.match(text, pos).end()
+        try:
+            if pos == len(text):
+                raise IndexError
+            if expected in ("{", ":"):
+                if text[pos] != expected:
+                    return
+                pos += 1
+                expected = "key" if expected == "{" else "value"
+            elif expected == "key":
+                if text[pos] == "}":
+                    return
+                key, pos = decoder.raw_decode(text, pos)
+                expected = ":"
+            elif expected == "value":
+                # Значення розбирається C-парсером json і одразу відкидається,
+                # потрібні лише його межі
+                _, end = decoder.raw_decode(text, pos)
+                if end == len(text) and not eof:
+                    raise IndexError
+                # Число, обірване перед дробовою частиною чи порядком
+                # ("12" з "12.5"), розбирається без помилки
+                if (text[pos] in NUMBER_START and text[end] in ".eE"
+                        and not eof):
+                    raise IndexError
+                mark_offset += len(text[mark:pos].encode("utf-8"))
+                length = len(text[pos:end].encode("utf-8"))
+                yield key, mark_offset, length
+                mark, mark_offset, pos = end, mark_offset + length, end
+                expected = ","
+            else:
+                if text[pos] != ",":
+                    return
+                pos += 1
+                expected = "key"
+        except (IndexError, ValueError):
+            # Значення обірване кінцем прочитаного шматка - дочитуємо файл
+            if eof:
+                return
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            mark_offset += len(text[mark:pos].encode("utf-8"))
+            text = text[pos:] + utf8.decode(chunk, final=eof)
+            mark = pos = 0
+
+
+class LazyRecords(MutableMapping):
+    """AddressBook.data backed by data.json that is scanned incrementally.
+    A Record is built only when it is accessed, unchanged records are
+    not kept in memory after they are no longer used."""
+
+    def __init__(self, filename, book):
+        self.filename = filename
+        self.book = book
+        self._open()
+        # Змінені записи з файлу, нові записи (у порядку додавання)
+        # та видалені записи тримаються окремо, доки книгу не збережено
+        self.changed = {}
+        self.appended = {}
+        self.deleted = set()
+        self.loaded = weakref.WeakValueDictionary()
+
+    def _open(self):
+        # offsets - позиції значень у файлі, names - імена у порядку файлу
+        self.offsets = {}
+        self.names = []
+        try:
+            self._file = open(self.filename, "rb")
+            self._scan_file = open(self.filename, "rb")
+        except FileNotFoundError:
+            self._file = self._scan_file = None
+            self._scanner = iter(())
+            self.scanned = True
+        else:
+            self._scanner = scan_json_object(self._scan_file)
+            # Чи весь файл уже просканований, тобто len() нічого не читає
+            self.scanned = False
+
+    def close(self):
+        for file in (self._file, self._scan_file):
+            if file is not None:
+                file.close()
+
+    def _scan_next(self):
+        """Scan one more value of the file. Return its name or None at the end."""
+        for key, offset, length in self._scanner:
+            if key not in self.offsets:
+                self.names.append(key)
+            self.offsets[key] = offset, length
+            return key
+        self.scanned = True
+        return None
+
+    def _scan(self, name=None):
+        # Продовжує сканування файлу, доки не знайдеться name
+        # (або до кінця файлу, якщо name не задано чи його немає)
+        if name in self.offsets:
+            return True
+        while True:
+            key = self._scan_next()
+            if key is None:
+                return False
+            if key == name:
+                return True
+
+    def _in_file(self, name):
+        return name not in self.deleted and self._scan(name)
+
+    def _read(self, name) -> bytes:
+        offset, length = self.offsets[name]
+        self._file.seek(offset)
+        return self._file.read(length).strip()
+
+    def __getitem__(self, name):
+        for records in (self.changed, self.appended, self.loaded):
+            if name in records:
+                return records[name]
+        if not self._in_file(name):
+            raise KeyError(name)
+        record = Record.from_dict(name, json.loads(self._read(name)), trusted=True)
+        record.book = self.book
+        self.loaded[name] = record
+        return record
+
+    def __setitem__(self, name, record):
+        if name in self.appended or not self._in_file(name):
+            self.appended[name] = record
+        else:
+            self.changed[name] = record
+        self.loaded[name] = record
+
+    def __delitem__(self, name):
+        if name in self.appended:
+            del self.appended[name]
+        elif self._in_file(name):
+            self.deleted.add(name)
+            self.changed.pop(name, None)
+        else:
+            raise KeyError(name)
+        self.loaded.pop(name, None)
+
+    def __contains__(self, name):
+        return name in self.appended or self._in_file(name)
+
+    def __iter__(self):
+        # Файл сканується лише настільки, наскільки просунулась ітерація.
+        # Список names може поповнюватися і під час неї, тому береться
+        # по одному імені
+        position = 0
+        while True:
+            if position == len(self.names):
+                if self._scan_next() is None:
+                    break
+                continue
+            name = self.names[position]
+            position += 1
+            if name not in self.deleted:
+                yield name
+        yield from list(self.appended)
+
+    def __len__(self):
+        self._scan()
+        # Видалені записи завжди є у файлі, а нові записи з іменами з файлу
+        # можуть з'явитися лише після видалення старих
+        return len(self.offsets) - len(self.deleted) + len(self.appended)
+
+    def record_changed(self, operation, name, *args):
+        # Змінений запис з файлу більше не можна прочитати з диска,
+        # тож він тримається у пам'яті до збереження
+        if name not in self.changed and name not in self.appended and name in self.loaded:
+            self.changed[name] = self.loaded[name]
+
+    def write(self, filename):
+        """Write all records to filename and continue reading from it."""
+        offsets = {}
+        with atomic_write(filename, "wb") as file:
+            file.write(b"{")
+            for number, name in enumerate(self):
+                file.write(b",\n    " if number else b"\n    ")
+                file.write(json.dumps(name, ensure_ascii=False).encode("utf-8") + b": ")
+                if name in self.changed or name in self.appended:
+                    value = json.dumps(self[name].to_dict(), indent=4, ensure_ascii=False)
+                    value = value.replace("\n", "\n    ").encode("utf-8")
+                else:
+                    value = self._read(name)
+                offsets[name] = file.tell(), len(value)
+                file.write(value)
+            file.write(b"\n}" if offsets else b"}")
+            # Старий файл закривається до заміни, бо Windows не дозволяє
+            # замінити відкритий файл
+            self.close()
+        self.filename = filename
+        self._open()
+        self.offsets = offsets
+        self.names = list(offsets)
+        self._scanner = iter(())
+        self.scanned = True
+        self.changed.clear()
+        self.appended.clear()
+        self.deleted.clear()
+
+
+class JsonBackend:
+    """Store the whole AddressBook in one json file.
+    Every save rewrites the file. With lazy=True records are read from
+    the file only when they are accessed."""
+
+    def __init__(self, filename="data.json", lazy=False):
+        self.filename = filename
+        self.lazy = lazy
+        # Стан файлу на момент читання та зміни, зроблені після нього
+        self.known = None
+        self.changes = []
+
+    def stamp(self):
+        return file_stamp(self.filename)
+
+    def load(self) -> AddressBook:
+        # Стан береться до читання: якщо файл підмінять посередині,
+        # збереження побачить розбіжність і об'єднає зміни
+        self.known = self.stamp()
+        book = self.read()
+        self.changes = []
+        book.listeners.append(self._record_change)
+        return book
+
+    def read(self) -> AddressBook:
+        if not self.lazy:
+            return AddressBook.open_file(self.filename)
+        book = AddressBook()
+        book.data = LazyRecords(self.filename, book)
+        book.listeners.append(book.data.record_changed)
+        return book
+
+    def _record_change(self, operation, name, *args):
+        self.changes.append((operation, name, *args))
+
+    def save(self, book: AddressBook):
+        """Write the book and return it. If another process changed the file
+        since it was read, return the book read again with our changes."""
+        with locked(self.filename):
+            if self.stamp() != self.known:
+                book = self.merge(book)
+            self.write(book)
+            self.known = self.stamp()
+            self.changes = []
+        return book
+
+    def merge(self, book: AddressBook) -> AddressBook:
+        # Операції ідемпотентні, тож їх можна застосувати до свіжої копії
+        # файлу. Record зберігається у поточному стані, тож повторні зміни
+        # того самого запису нічого не псують
+        changes = self.changes
+        fresh = self.load()
+        for operation, name, *args in changes:
+            Journal._apply(fresh, operation, name, *map(Journal._plain, args))
+        return fresh
+
+    def write(self, book: AddressBook):
+        if isinstance(book.data, LazyRecords):
+            book.data.write(self.filename)
+        else:
+            book.write_to_file(self.filename)
+
+
+class Journal:
+    """Append-only log of AddressBook changes.
+    Each line is a json list [operation, name, *arguments]."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.size = 0
+        self._file = None
+        # Рядки, що чекають на запис, поки збереження відкладене (hold).
+        # None - кожен рядок записується одразу
+        self.pending = None
+        # Стан файлу після останнього власного читання чи запису
+        self.known = None
+        self.foreign = False
+
+    @staticmethod
+    def _plain(value):
+        # Phone, Birthday, Email зберігаються як рядок, Address - як словник
+        if isinstance(value, Record):
+            return value.to_dict()
+        if isinstance(value, Address):
+            return value.to_dict()
+        if isinstance(value, (Phone, Birthday, Email)):
+            return value.value
+        return value
+
+    def __call__(self, operation, name, *args):
+        # Журнал підписаний на зміни адресної книги (AddressBook.listeners).
+        # Кожна операція дописується у кінець файлу одним рядком та одразу
+        # скидається на диск, тож запис коштує O(1) незалежно від розміру книги
+        line = json.dumps([operation, name, *map(self._plain, args)],
+                          ensure_ascii=False) + "\n"
+        self.size += 1
+        if self.pending is not None:
+            self.pending.append(line)
+            return
+        self._append([line])
+
+    def _append(self, lines):
+        if self._file is None:
+            self._file = open(self.filename, "a", encoding="utf-8")
+        # Блокування не дає рядкам двох процесів перемішатися
+        with locked(self.filename):
+            if file_stamp(self.filename) != self.known:
+                self.foreign = True
+            self._file.write("".join(lines))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.known = file_stamp(self.filename)
+
+    def changed_by_others(self) -> bool:
+        """Return True if another process wrote to the journal since it was
+        read. Call it while the journal is locked."""
+        return self.foreign or file_stamp(self.filename) != self.known
+
+    def hold(self):
+        """Keep new lines in memory until flush."""
+        if self.pending is None:
+            self.pending = []
+
+    def flush(self):
+        """Write held lines with one fsync and write next lines at once again."""
+        lines, self.pending = self.pending, None
+        if lines:
+            self._append(lines)
+
+    @staticmethod
+    def _apply(book: AddressBook, operation, name, *args):
+        if operation == "put":
+            book.add_record(Record.from_dict(name, args[0], trusted=True))
+            return
+        record = book.get(name)
+        if record is None:
+            return
+        if operation == "delete_record":
+            del book[name]
+        elif operation == "add_phone":
+            record.add_phone(Phone(args[0]))
+        elif operation == "change_phone":
+            record.change_phone(Phone(args[0]), Phone(args[1]))
+        elif operation == "delete_phone":
+            record.delete_phone(Phone(args[0]))
+        elif operation == "change_birthday":
+            record.change_birthday(Birthday(args[0]))
+        elif operation == "change_address":
+            record.change_address(Address(**args[0]))
+        elif operation == "change_email":
+            record.change_email(Email.trusted(args[0]))
+
+    def replay(self, book: AddressBook):
+        self.size = 0
+        try:
+            file = open(self.filename, "r+", encoding="utf-8")
+        except FileNotFoundError:
+            return
+        with file:
+            good_end = 0
+            for line in iter(file.readline, ""):
+                try:
+                    if not line.endswith("\n"):
+                        raise ValueError
+                    operation = json.loads(line)
+                except ValueError:
+                    # Обірваний останній рядок (програма впала під час запису).
+                    # Його відкидаємо, щоб наступні записи не приклеїлись до нього
+                    file.truncate(good_end)
+                    break
+                self._apply(book, *operation)
+                good_end = file.tell()
+                self.size += 1
+
+    def clear(self):
+        # Знімок уже містить зміни з незаписаних рядків
+        if self.pending is not None:
+            self.pending = []
+        self.close()
+        open(self.filename, "w", encoding="utf-8").close()
+        self.size = 0
+        self.known = file_stamp(self.filename)
+        self.foreign = False
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class JournalBackend(JsonBackend):
+    """Keep json file as a snapshot and append every change to a journal.
+    When the journal grows to compact_every operations it is folded into
+    a new snapshot."""
+
+    def __init__(self, filename="data.json", lazy=False, compact_every=1000):
+        super().__init__(filename, lazy)
+        self.journal = Journal(filename + ".journal")
+        self.compact_every = compact_every
+
+    def stamp(self):
+        return super().stamp(), file_stamp(self.journal.filename)
+
+    def load(self) -> AddressBook:
+        self.journal.close()
+        # Знімок і журнал читаються під блокуванням, щоб інший процес не
+        # ущільнив журнал посередині, а обрізання обірваного рядка не
+        # зачепило рядок, який інший процес саме дописує
+        with locked(self.journal.filename):
+            self.known = super().stamp()
+            book = self.read()
+            self.journal.replay(book)
+            self.journal.known = file_stamp(self.journal.filename)
+            self.journal.foreign = False
+        book.listeners.append(self.journal)
+        return book
+
+    def save(self, book: AddressBook):
+        """Compact the journal when it is long enough and return the book.
+        If another process changed the snapshot or the journal, return
+        the book read again with our changes."""
+        # Зміни вже у журналі (або чекають у ньому на запис), тож тут лише
+        # перевірка чужих змін та періодичне ущільнення
+        with locked(self.journal.filename):
+            if (self.journal.changed_by_others()
+                    or super().stamp() != self.known):
+                book = self.merge(book)
+            if self.journal.size >= self.compact_every:
+                self.compact(book)
+        self.journal.flush()
+        return book
+
+    def merge(self, book: AddressBook) -> AddressBook:
+        # Записані рядки журналу (і чужі, і власні) вже на диску, тож їх
+        # відтворює load. Незаписані рядки застосовуються до свіжої книги
+        # і знову потрапляють у журнал як відкладені
+        pending, self.journal.pending = self.journal.pending, None
+        fresh = self.load()
+        if pending is not None:
+            self.journal.pending = []
+            for line in pending:
+                Journal._apply(fresh, *json.loads(line))
+        return fresh
+
+    def hold(self):
+        self.journal.hold()
+
+    def release(self):
+        self.journal.flush()
+
+    def compact(self, book: AddressBook):
+        # Новий знімок пишеться у тимчасовий файл і підміняє старий,
+        # тому падіння посередині не зіпсує ні знімок, ні журнал.
+        # Операції журналу ідемпотентні, тож якщо програма впаде між
+        # заміною знімка і очищенням журналу, повторне застосування безпечне
+        with locked(self.journal.filename):
+            self.write(book)
+            self.known = super().stamp()
+            self.journal.clear()
+
+
+class NoteBookJsonBackend:
+    """Store the whole NoteBook in one json file."""
+
+    def __init__(self, filename="notebook.json"):
+        self.filename = filename
+        # Стан файлу на момент читання та зміни, зроблені після нього
+        self.known = None
+        self.changes = []
+
+    def stamp(self):
+        return file_stamp(self.filename)
+
+    def load(self) -> NoteBook:
+        self.known = self.stamp()
+        notebook = NoteBook.read_from_file(self.filename)
+        self.changes = []
+        notebook.listeners.append(self._record_change)
+        return notebook
+
+    def _record_change(self, operation, note_id, *args):
+        self.changes.append((operation, note_id, *args))
+
+    def save(self, notebook: NoteBook):
+        """Write the notebook and return it. If another process changed
+        the file since it was read, return the notebook read again with
+        our changes."""
+        with locked(self.filename):
+            if self.stamp() != self.known:
+                notebook = self.merge(notebook)
+            notebook.save_to_file(self.filename)
+            self.known = self.stamp()
+            self.changes = []
+        return notebook
+
+    def merge(self, notebook: NoteBook) -> NoteBook:
+        changes = self.changes
+        fresh = self.load()
+        fresh.next_id = max(fresh.next_id or 0, notebook.next_id or 0) or None
+        # Номер нової нотатки міг зайняти інший процес, тоді вона отримує
+        # новий номер, а наступні зміни цієї нотатки йдуть під ним
+        renamed = {}
+        for operation, note_id, *args in changes:
+            if operation == "add" and note_id in fresh.data:
+                renamed[note_id] = fresh.allocate_id()
+            new_id = renamed.get(note_id, note_id)
+            if operation == "delete":
+                fresh.pop(new_id, None)
+            else:
+                fresh[new_id] = Note(args[0].text, new_id)
+        return fresh
+
+
+class SqliteDatabase:
+    """Connection to the SQLite file with contacts and notes."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS records (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            birthday TEXT NOT NULL DEFAULT '',
+            street TEXT NOT NULL DEFAULT '',
+            city TEXT NOT NULL DEFAULT '',
+            country TEXT NOT NULL DEFAULT '',
+            postcode TEXT NOT NULL DEFAULT '',
+            email TEXT NOT NULL DEFAULT ''
+        );
+        CREATE INDEX IF NOT EXISTS records_email ON records (email);
+        CREATE TABLE IF NOT EXISTS phones (
+            record_id INTEGER NOT NULL REFERENCES records (id) ON DELETE CASCADE,
+            phone TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS phones_record ON phones (record_id);
+        CREATE INDEX IF NOT EXISTS phones_phone ON phones (phone);
+        CREATE TABLE IF NOT EXISTS notes (
+            id TEXT PRIMARY KEY,
+            text TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS note_tags (
+            note_id TEXT NOT NULL REFERENCES notes (id) ON DELETE CASCADE,
+            tag TEXT NOT NULL,
+            PRIMARY KEY (note_id, tag)
+        );
+        CREATE INDEX IF NOT EXISTS note_tags_tag ON note_tags (tag);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, filename="ostap.db"):
+        self.filename = filename
+        # Відкладені збереження (Session.delay) комітять з іншого потоку,
+        # доступ до з'єднання впорядковує Session.lock
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(self.SCHEMA)
+
+    def stamp(self):
+        # data_version змінюється лише тоді, коли у базу записало інше з'єднання
+        # (наприклад, інший запущений Ostap)
+        return self.connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def commit(self):
+        self.connection.commit()
+
+    def get_meta(self, key):
+        row = self.connection.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def set_meta(self, key, value):
+        self.connection.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value", (key, str(value)))
+
+
+class SqliteRecords(MutableMapping):
+    """AddressBook.data stored in SQLite tables.
+    Records are built from rows on access, so nothing is loaded up front."""
+
+    SELECT = """
+        SELECT name, birthday, street, city, country, postcode, email,
+               (SELECT group_concat(phone, ' ') FROM
+                   (SELECT phone FROM phones WHERE record_id = records.id
+                    ORDER BY rowid))
+        FROM records
+    """
+
+    def __init__(self, connection, book):
+        self.connection = connection
+        self.book = book
+
+    def _record(self, row):
+        name, birthday, street, city, country, postcode, email, phones = row
+        phones = [Phone(phone) for phone in phones.split()] if phones else []
+        record = Record(Name(name), phones, Birthday(birthday),
+                        Address(street, city, country, postcode), Email.trusted(email))
+        record.book = self.book
+        return record
+
+    def _records(self, where="", params=()):
+        cursor = self.connection.execute(f"{self.SELECT} {where} ORDER BY id", params)
+        return (self._record(row) for row in cursor)
+
+    def __getitem__(self, name):
+        for record in self._records("WHERE name = ?", (name,)):
+            return record
+        raise KeyError(name)
+
+    def __setitem__(self, name, record):
+        values = record.to_dict()
+        address = values["address"]
+        # Оновлення існуючого рядка (а не REPLACE) зберігає його id,
+        # тобто порядок записів, як у звичайному словнику
+        self.connection.execute(
+            "INSERT INTO records (name, birthday, street, city, country, postcode, email) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET birthday = excluded.birthday, "
+            "street = excluded.street, city = excluded.city, "
+            "country = excluded.country, postcode = excluded.postcode, "
+            "email = excluded.email",
+            (name, values["birthday"], address["street"], address["city"],
+             address["country"], address["postcode"], values["email"]))
+        record_id = self.connection.execute(
+            "SELECT id FROM records WHERE name = ?", (name,)).fetchone()[0]
+        self.connection.execute("DELETE FROM phones WHERE record_id = ?", (record_id,))
+        self.connection.executemany(
+            "INSERT INTO phones (record_id, phone) VALUES (?, ?)",
+            [(record_id, phone) for phone in values["phones"]])
+
+    def __delitem__(self, name):
+        cursor = self.connection.execute("DELETE FROM records WHERE name = ?", (name,))
+        if not cursor.rowcount:
+            raise KeyError(name)
+
+    def __contains__(self, name):
+        return self.connection.execute(
+            "SELECT 1 FROM records WHERE name = ?", (name,)).fetchone() is not None
+
+    def __iter__(self):
+        cursor = self.connection.execute("SELECT name FROM records ORDER BY id")
+        return (name for name, in cursor)
+
+    def __len__(self):
+        return self.connection.execute("SELECT count(*) FROM records").fetchone()[0]
+
+    def values(self):
+        return self._records()
+
+    def items(self):
+        return ((record.name.value, record) for record in self._records())
+
+    def search(self, field, text):
+        if field == "name":
+            return self._records("WHERE instr(name, ?) > 0", (text,))
+        if field == "phone":
+            return self._records(
+                "WHERE id IN (SELECT record_id FROM phones WHERE instr(phone, ?) > 0)",
+                (text,))
+        if field == "email":
+            return self._records("WHERE instr(lower(email), ?) > 0", (text.lower(),))
+        return iter(())
+
+    def record_changed(self, operation, name, *args):
+        # Додавання та видалення цілого запису обробляють __setitem__ та
+        # __delitem__, тут - зміни окремих полів, що зачіпають один рядок
+        record_id = "(SELECT id FROM records WHERE name = :name)"
+        if operation == "add_phone":
+            self.connection.execute(
+                f"INSERT INTO phones (record_id, phone) VALUES ({record_id}, :phone)",
+                {"name": name, "phone": args[0].value})
+        elif operation == "change_phone":
+            self.connection.execute(
+                "UPDATE phones SET phone = :new WHERE rowid = "
+                f"(SELECT rowid FROM phones WHERE record_id = {record_id} "
+                "AND phone = :old ORDER BY rowid LIMIT 1)",
+                {"name": name, "old": args[0].value, "new": args[1].value})
+        elif operation == "delete_phone":
+            self.connection.execute(
+                "DELETE FROM phones WHERE rowid = "
+                f"(SELECT rowid FROM phones WHERE record_id = {record_id} "
+                "AND phone = :phone ORDER BY rowid LIMIT 1)",
+                {"name": name, "phone": args[0].value})
+        elif operation == "change_birthday":
+            self.connection.execute(
+                "UPDATE records SET birthday = ? WHERE name = ?",
+                (args[0].value, name))
+        elif operation == "change_address":
+            address = args[0]
+            self.connection.execute(
+                "UPDATE records SET street = ?, city = ?, country = ?, postcode = ? "
+                "WHERE name = ?",
+                (address.street, address.city, address.country, address.postcode, name))
+        elif operation == "change_email":
+            self.connection.execute(
+                "UPDATE records SET email = ? WHERE name = ?", (args[0].value, name))
+
+
+class SqliteNotes(MutableMapping):
+    """NoteBook.data stored in SQLite tables with an index on tags."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def _notes(self, where="", params=()):
+        cursor = self.connection.execute(
+            f"SELECT id, text FROM notes {where} ORDER BY rowid", params)
+        return (Note(text, note_id) for note_id, text in cursor)
+
+    def __getitem__(self, note_id):
+        for note in self._notes("WHERE id = ?", (note_id,)):
+            return note
+        raise KeyError(note_id)
+
+    def __setitem__(self, note_id, note):
+        self.connection.execute(
+            "INSERT INTO notes (id, text) VALUES (?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET text = excluded.text",
+            (note_id, note.text))
+        self.connection.execute("DELETE FROM note_tags WHERE note_id = ?", (note_id,))
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO note_tags (note_id, tag) VALUES (?, ?)",
+            [(note_id, tag) for tag in note.tags])
+
+    def __delitem__(self, note_id):
+        cursor = self.connection.execute("DELETE FROM notes WHERE id = ?", (note_id,))
+        if not cursor.rowcount:
+            raise KeyError(note_id)
+
+    def __contains__(self, note_id):
+        return self.connection.execute(
+            "SELECT 1 FROM notes WHERE id = ?", (note_id,)).fetchone() is not None
+
+    def __iter__(self):
+        cursor = self.connection.execute("SELECT id FROM notes ORDER BY rowid")
+        return (note_id for note_id, in cursor)
+
+    def __len__(self):
+        return self.connection.execute("SELECT count(*) FROM notes").fetchone()[0]
+
+    def values(self):
+        return self._notes()
+
+    def items(self):
+        return ((note.id, note) for note in self._notes())
+
+    def find_by_tags(self, tags, match_all=True):
+        # Для пошуку за усіма тегами нотатка має мати стільки рядків
+        # у note_tags, скільки тегів у запиті
+        having = f"HAVING count(*) = {len(tags)}" if match_all else ""
+        placeholders = ", ".join("?" * len(tags))
+        return self._notes(
+            f"WHERE id IN (SELECT note_id FROM note_tags WHERE tag IN ({placeholders}) "
+            f"GROUP BY note_id {having})", tags)
+
+    def find_by_text(self, text):
+        return self._notes("WHERE instr(text, ?) > 0", (text,))
+
+
+class SqliteBackend:
+    """Store AddressBook in SQLite. Every change touches only its own rows,
+    save just commits the transaction."""
+
+    def __init__(self, database: SqliteDatabase):
+        self.database = database
+
+    def stamp(self):
+        return self.database.stamp()
+
+    def load(self) -> AddressBook:
+        book = AddressBook()
+        book.data = SqliteRecords(self.database.connection, book)
+        book.listeners.append(book.data.record_changed)
+        return book
+
+    def save(self, book: AddressBook):
+        self.database.commit()
+
+
+class SqliteNoteBookBackend:
+    """Store NoteBook in SQLite."""
+
+    def __init__(self, database: SqliteDatabase):
+        self.database = database
+
+    def stamp(self):
+        return self.database.stamp()
+
+    def load(self) -> NoteBook:
+        notebook = NoteBook()
+        notebook.data = SqliteNotes(self.database.connection)
+        next_id = self.database.get_meta("next_note_id")
+        notebook.next_id = None if next_id is None else int(next_id)
+        return notebook
+
+    def save(self, notebook: NoteBook):
+        if notebook.next_id is not None:
+            self.database.set_meta("next_note_id", notebook.next_id)
+        self.database.commit()
+
+
+STORAGES = ("json", "journal", "sqlite")
+
+
+def open_storage(kind="json", lazy=False):
+    """Take as input storage kind. Return backends for AddressBook and NoteBook"""
+    if kind == "sqlite":
+        database = SqliteDatabase()
+        return SqliteBackend(database), SqliteNoteBookBackend(database)
+    if kind == "journal":
+        return JournalBackend(lazy=lazy), NoteBookJsonBackend()
+    return JsonBackend(lazy=lazy), NoteBookJsonBackend()
+
+
+def migrate_to_sqlite(data_filename="data.json", notes_filename="notebook.json",
+                      db_filename="ostap.db"):
+    """Copy contacts and notes from json files to SQLite database."""
+    database = SqliteDatabase(db_filename)
+    book = SqliteBackend(database).load()
+    for name, record in AddressBook.open_file(data_filename).data.items():
+        book[name] = record
+    notes_backend = SqliteNoteBookBackend(database)
+    notebook = notes_backend.load()
+    notes = NoteBook.read_from_file(notes_filename)
+    for note_id, note in notes.data.items():
+        notebook[note_id] = note
+    if notes.next_id is not None:
+        notebook.next_id = max(notebook.next_id or 0, notes.next_id)
+    notes_backend.save(notebook)
+    msg = f"Migrated {len(book.data)} contacts and {len(notebook.data)} notes to {db_filename}."
+    database.connection.close()
+    return msg
+
+
+class Session:
+    """Keep loaded AddressBook or NoteBook for the whole lifetime of the program.
+    The data is read again only when the storage was changed on disk.
+    With delay (in seconds) saves are grouped: all saves made within delay
+    after the first one are written once."""
+
+    def __init__(self, backend, delay=None):
+        self._deferred = False
+        self._dirty = False
+        self._timer = None
+        self._data = None
+        self.delay = delay
+        # Відкладене збереження виконується у потоці таймера, тож зміни
+        # даних і запис мають відбуватися під цим блокуванням
+        self.lock = threading.RLock()
+        self.use(backend)
+
+    def use(self, backend):
+        self.flush()
+        self.backend = backend
+        self._data = None
+        self._stamp = None
+
+    @property
+    def data(self):
+        stamp = self.backend.stamp()
+        # Поки є незаписані зміни, дані не перечитуються, щоб їх не втратити
+        if self._data is None or (stamp != self._stamp and not self._dirty):
+            self._data = self.backend.load()
+            self._stamp = self.backend.stamp()
+        return self._data
+
+    def save(self):
+        if self._data is None:
+            return
+        if self._deferred:
+            self._dirty = True
+            return
+        if self.delay:
+            with self.lock:
+                self._dirty = True
+                if self._timer is None:
+                    self._timer = threading.Timer(self.delay, self.flush)
+                    self._timer.start()
+            return
+        self._write()
+
+    def _write(self):
+        with self.lock:
+            # Якщо файл змінив інший процес, backend повертає перечитані
+            # дані разом з нашими змінами
+            data = self.backend.save(self._data)
+            if data is not None:
+                self._data = data
+            self._stamp = self.backend.stamp()
+
+    def flush(self):
+        """Write the grouped saves now."""
+        with self.lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._dirty and not self._deferred:
+                self._dirty = False
+                self._write()
+
+    @contextmanager
+    def deferred(self):
+        """Postpone all saves made inside the block and save once at its end.
+        The backend may also postpone its own writes (JournalBackend.hold)."""
+        # Вкладений блок (import у пакетному режимі) зберігає лише зовнішній
+        if self._deferred:
+            yield self
+            return
+        backend = self.backend
+        self._deferred = True
+        if hasattr(backend, "hold"):
+            backend.hold()
+        try:
+            yield self
+        finally:
+            self._deferred = False
+            try:
+                if self._dirty:
+                    self._dirty = False
+                    self.save()
+            finally:
+                if hasattr(backend, "release"):
+                    backend.release()
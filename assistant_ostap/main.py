@@ -1,12 +1,34 @@
-import logging
-import re
-
-from fuzzywuzzy import fuzz, process
-import readline
+import argparse
+from contextlib import redirect_stdout
+from functools import lru_cache
+import json
+import sys
 
 import assistant_ostap.assistant_ostap.classes as classes
-from assistant_ostap.assistant_ostap.handlers import commands
+from assistant_ostap.assistant_ostap.handlers import command_tree, commands, notes_session, session
 from assistant_ostap.assistant_ostap.notes import NoteBook
+from assistant_ostap.assistant_ostap.paging import PAGE_SIZE, PageView
+from assistant_ostap.assistant_ostap.prompts import answering
+from assistant_ostap.assistant_ostap.storage import STORAGES, migrate_to_sqlite, open_storage
+
+
+def subtree_commands(node):
+    """Yield all commands in the node of command_tree and below it."""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if None in node:
+            yield node[None]
+        stack.extend(reversed([child for word, child in node.items() if word is not None]))
+
+
+# Команди реєструються лише при імпорті handlers, тож варіанти
+# для кожного початку команди достатньо знайти один раз
+@lru_cache(maxsize=None)
+def completions(text: str) -> tuple:
+    return tuple(command for word, node in command_tree.items()
+                 if word is not None and word.startswith(text)
+                 for command in subtree_commands(node))
 
 
 # Даний метод відповідає за автозаповнення команд. Якщо у консолі
@@ -16,54 +38,176 @@ from assistant_ostap.assistant_ostap.notes import NoteBook
 def completer(text, state):
     if not text.isalpha():
         return None
-    options = [cmd for cmd in commands.keys() if cmd.startswith(text.lower())]
-    if not options:
-        return None
+    options = completions(text.lower())
     if state < len(options):
         return options[state]
     return None
 
 
+# fuzzywuzzy потрібен лише для помилково введених команд, тож імпортується
+# при першій такій команді, а не при запуску програми
+@lru_cache(maxsize=None)
+def fuzzy():
+    import logging
+    from fuzzywuzzy import fuzz, process
+
+    # fuzzywuzzy пише у лог попередження про порожній ввід
+    logging.basicConfig(level=logging.ERROR)
+    return fuzz, process
+
+
+# Користувачі часто повторюють ті самі помилки, тож підказки кешуються
+@lru_cache(maxsize=256)
+def suggest_command(user_command: str):
+    """Return the most similar command or None if no command is similar enough."""
+    fuzz, process = fuzzy()
+    best_match, match_ratio = process.extractOne(user_command,
+                                                 list(commands),
+                                                 scorer=fuzz.ratio)
+    # Коефіцієнт 60 виведений експерементальним шляхом
+    return best_match if match_ratio >= 60 else None
+
+
 def parse_command(user_input: str):
-    # Даний регулярний вираз шукає команди, що складаються більше, ніж з одного слова.
-    # Тобто це good bye, show all, del phone та del user.
-    # Якщо користувач ввів одну із цих команд, командою вважатимуться перші два слова,
-    # а аргументами - все, починаючи з третього. Я
-    # кщо ж команда складаєтсья з одного слова(блок else),
-    # то аргументами є все, починаючи з другого елементу
-    match = re.search(
-        r"^show\s|^good\s|^del\s|^sort\s|^change\s|^add\s", user_input.lower())
-    try:
-        if match:
-            user_command = " ".join(user_input.split()[:2]).lower()
-            command_arguments = user_input.split()[2:]
-        else:
-            user_command = user_input.split()[0].lower()
-            command_arguments = user_input.split()[1:]
-    except IndexError:
+    # Ввід ділиться на слова один раз, а команда шукається проходом по
+    # дереву command_tree: командою вважається найдовший збіг з початку вводу
+    # (наприклад, show all, del phone), аргументами - решта слів
+    words = user_input.split()
+    if not words:
         return "Please enter a command name."
+    node = command_tree
+    user_command = None
+    for position, word in enumerate(words):
+        node = node.get(word.lower())
+        if node is None:
+            break
+        if None in node:
+            user_command, command_length = node[None], position + 1
+    if user_command is not None:
+        return commands[user_command](*words[command_length:])
 
     # Тут обробляються випадки, коли користувач ввів нвідому команду.
+    # Якщо перше слово починає команди з кількох слів (show, del, add...),
+    # з командами порівнюються два перші слова, інакше - лише перше.
     # Якщо ввід схожий на існуючу команду, наприклад, chanle, то
     # повернеться повідомлення: "Можливо Ви мали на увазі change"
-    # Якщо ж жодна із команд не буде достатньо подібною до
-    # вводу користувача(за це відповідає змінна match_ratio
-    # та коефіцієнт 60, виведений експерементальним шляхом),
-    # повернеться повідомлення про те що команду не знайдено.
-    if user_command not in commands.keys():
-        logging.basicConfig(level=logging.ERROR)
-        best_match, match_ratio = process.extractOne(user_command,
-                                                     commands.keys(),
-                                                     scorer=fuzz.ratio)
-        if match_ratio >= 60:
-            return f"Command not found.\nPerhaps you meant '{best_match}'."
+    first = command_tree.get(words[0].lower(), {})
+    length = 2 if any(word is not None for word in first) else 1
+    best_match = suggest_command(" ".join(words[:length]).lower())
+    if best_match is not None:
+        return f"Command not found.\nPerhaps you meant '{best_match}'."
+    return "Command not found.\nTo view all available commands, enter 'help'."
+
+
+def run_batch(file):
+    """Run commands from a JSON lines file. Each line is an object like
+    {"command": "change email", "args": {"name": "Ostap", "email": "o@ua.com"}},
+    where args answer the prompts of the command. All commands work with
+    the same loaded contacts and notes, which are saved once at the end."""
+    output = []
+    with session.deferred(), notes_session.deferred():
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+                user_input = item["command"]
+                answers = item.get("args", {})
+                if not isinstance(user_input, str) or not isinstance(answers, dict):
+                    raise TypeError
+            except (ValueError, KeyError, TypeError, AttributeError):
+                output.append({"line": number, "error": "Invalid command line"})
+                continue
+            # Усе, що команди друкують самі (таблиця help, звіт sort files),
+            # йде у stderr, щоб у stdout були лише JSON рядки
+            try:
+                with answering(answers), redirect_stdout(sys.stderr):
+                    result = parse_command(user_input)
+            except SystemExit:
+                # exit у файлі зупиняє виконання, але результати
+                # попередніх команд зберігаються та виводяться
+                output.append({"line": number, "command": user_input, "result": "exit"})
+                break
+            except Exception as error:
+                # Помилка однієї команди не зупиняє решту файлу
+                output.append({"line": number, "command": user_input, "error": str(error)})
+                continue
+            if isinstance(result, (classes.AddressBook, NoteBook, PageView)):
+                result = "\n".join(str(value) for page in result for value in page)
+            output.append({"line": number, "command": user_input,
+                           "result": None if result is None else str(result)})
+    # Згруповані збереження (--group-commit) записуються до виводу результатів
+    session.flush()
+    notes_session.flush()
+    # Результати виводяться разом, коли дані вже збережені
+    sys.stdout.write("".join(json.dumps(item, ensure_ascii=False) + "\n"
+                             for item in output))
+
+
+def show_pages(view: PageView):
+    """Show pages of the view one by one. The user can enter a page number to jump to it."""
+    page = next(view, None)
+    while page is not None:
+        commands["clear"]()
+        print("\n".join(str(item) for item in page))
+        # Загальна кількість сторінок невідома, поки ледача книга не прочитана
+        pages = view.known_pages
+        print(f"Page {view.page} of {'?' if pages is None else pages}")
+        user_input = input("Press 'q' to quit, enter a page number to go to it "
+                           "or press any key to see the next page: ").strip()
+        if user_input.lower() == "q":
+            break
+        if user_input.isdigit():
+            page = view.get_page(min(max(int(user_input), 1), view.pages))
         else:
-            return "Command not found.\nTo view all available commands, enter 'help'."
-    else:
-        return commands[user_command](*command_arguments)
+            page = next(view, None)
 
 
 def main():
+    parser = argparse.ArgumentParser(prog="Ostap",
+                                     description="Your personal assistant Ostap")
+    # json - весь файл перезаписується після кожної зміни,
+    # journal - зміни дописуються у журнал data.json.journal,
+    # sqlite - контакти та нотатки зберігаються у базі ostap.db
+    parser.add_argument("--storage", choices=STORAGES, default="json",
+                        help="how to store contacts and notes")
+    parser.add_argument("--migrate", action="store_true",
+                        help="copy data.json and notebook.json to ostap.db "
+                             "before start (use with --storage sqlite)")
+    # З --lazy записи читаються з data.json лише тоді, коли вони потрібні
+    parser.add_argument("--lazy", action="store_true",
+                        help="read contacts from data.json only when they are "
+                             "needed (json and journal storage)")
+    # "-" замість імені файлу означає стандартний ввід
+    parser.add_argument("--batch", metavar="FILE",
+                        type=argparse.FileType("r", encoding="utf-8"),
+                        help="run commands from a JSON lines file and exit")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE, metavar="N",
+                        help="how many contacts or notes 'show all' shows on a page")
+    # Збереження, зроблені командами протягом MS мілісекунд, записуються
+    # на диск одним записом
+    parser.add_argument("--group-commit", type=int, default=0, metavar="MS",
+                        help="write saves made within MS milliseconds at once")
+    args = parser.parse_args()
+    if args.page_size < 1:
+        parser.error("--page-size must be positive")
+    if args.migrate:
+        if args.storage != "sqlite":
+            parser.error("--migrate can be used only with --storage sqlite")
+        print(migrate_to_sqlite())
+    book_backend, notes_backend = open_storage(args.storage, args.lazy)
+    session.use(book_backend)
+    notes_session.use(notes_backend)
+    if args.group_commit > 0:
+        session.delay = notes_session.delay = args.group_commit / 1000
+    if args.batch:
+        with args.batch:
+            run_batch(args.batch)
+        return
+
+    # readline потрібен лише для консолі, тож пакетний режим його не завантажує
+    import readline
+
     # Ці дві лінійки безпосередньо пов'язані з функцією completer.
     # Вони відповідають за те, при натисканні на яку кнопку відбуватиметься автодоповнення.
     readline.set_completer(completer)
@@ -71,21 +215,19 @@ def main():
     print("How can I help you?")
     while True:
         user_input = input("Enter command: ")
-        result = parse_command(user_input)
-
-        if result:
-            # Якщо повернули ітератор(тобто команда show all), проходимося по ньому в циклі,
-            #  поступово показуючи записи
-            if isinstance(result, classes.AddressBook) or isinstance(result, NoteBook):
-                for page in result:
-                    commands["clear"]()
-                    print("\n".join([str(i) for i in page]))
-                    user_input = input(
-                        "Press 'q' to quit. Press any key to see the next page: ")
-                    if user_input.lower() == "q":
-                        break
-            else:
-                print(result)
+        # Поки команда працює з даними, згруповане збереження чекає
+        with session.lock, notes_session.lock:
+            result = parse_command(user_input)
+
+            if result:
+                # Контакти та нотатки показуються посторінково
+                if isinstance(result, (classes.AddressBook, NoteBook)):
+                    result = PageView(result)
+                if isinstance(result, PageView):
+                    result.page_size = args.page_size
+                    show_pages(result)
+                else:
+                    print(result)
 
 
 if __name__ == "__main__":
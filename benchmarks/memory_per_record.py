@@ -0,0 +1,75 @@
+"""Measure memory used by one contact and one note.
+
+Run from the repository root:
+    python benchmarks/memory_per_record.py [count]
+"""
+import gc
+import os
+import sys
+import tracemalloc
+
+# Скрипт запускається з benchmarks/, тож корінь репозиторію додається вручну
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from assistant_ostap.assistant_ostap.classes import (AddressBook, Address, Birthday,
+                                                     Email, Name, Phone, Record)
+from assistant_ostap.assistant_ostap.notes import Note, NoteBook
+
+
+def contact(number):
+    # Ті самі поля, що й у data.json. Місто та країна повторюються,
+    # як це зазвичай буває у справжній книзі
+    return {
+        "phones": [f"380{number:09d}", f"+380{number + 1:09d}"],
+        "birthday": f"{number % 28 + 1:02d}.{number % 12 + 1:02d}.1990",
+        "address": {"street": f"Street {number}", "city": ["Kyiv", "Lviv", "Odesa"][number % 3],
+                    "country": "Ukraine", "postcode": f"{number % 90000 + 10000}"},
+        "email": f"user{number}@example.com",
+    }
+
+
+def make_record(name, fields):
+    # Лише конструктори, які є і в першій версії програми, тож скрипт
+    # показує число "до" на старому коді
+    return Record(Name(name), [Phone(phone) for phone in fields["phones"]],
+                  Birthday(fields["birthday"]), Address(**fields["address"]),
+                  Email(fields["email"]))
+
+
+def measure(build, count):
+    # Вихідні дані створюються до початку вимірювання, тож рахується
+    # лише пам'ять самих об'єктів
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build(count)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / count, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    contacts = [(f"User {number}", contact(number)) for number in range(count)]
+    texts = [f"Note {number} about #work and #home" for number in range(count)]
+
+    def build_book(count):
+        book = AddressBook()
+        for name, record in contacts:
+            book.add_record(make_record(name, record))
+        return book
+
+    def build_notebook(count):
+        notebook = NoteBook()
+        for number, text in enumerate(texts):
+            notebook[str(number)] = Note(text, str(number))
+        return notebook
+
+    per_record, _ = measure(build_book, count)
+    print(f"AddressBook: {per_record:.0f} bytes per record ({count} records)")
+    per_note, _ = measure(build_notebook, count)
+    print(f"NoteBook: {per_note:.0f} bytes per note ({count} notes)")
+
+
+if __name__ == "__main__":
+    main()
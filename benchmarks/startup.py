@@ -0,0 +1,68 @@
+"""Check that the Ostap console starts fast enough.
+
+Run from the repository root:
+    python benchmarks/startup.py [budget in ms]
+
+Imports assistant_ostap.main in fresh interpreters with -X importtime and
+exits with status 1 if the median start time is over the budget or if
+modules that should load on first use were imported at start.
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BUDGET_MS = 100
+RUNS = 7
+# Модулі, які мають завантажуватися лише тоді, коли вони потрібні команді
+LAZY_MODULES = ("rich", "fuzzywuzzy", "readline",
+                "assistant_ostap.assistant_ostap.clean",
+                "assistant_ostap.assistant_ostap.columnar",
+                "assistant_ostap.assistant_ostap.exchange")
+CODE = "import sys, assistant_ostap.main; print(' '.join(sys.modules))"
+
+
+def run(env):
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", CODE],
+                            capture_output=True, text=True, env=env, check=True)
+    elapsed = (time.perf_counter() - started) * 1000
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            # Вкладені імпорти мають більший відступ перед назвою,
+            # він зберігається, щоб показати, хто що імпортує
+            depth = len(name) - len(name.lstrip())
+            imports.append((int(cumulative) / 1000, depth, name.strip()))
+    return elapsed, imports, set(result.stdout.split())
+
+
+def main():
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else BUDGET_MS
+    # Встановлена програма має скомпільований байт-код, тож його запис дозволяється,
+    # а перший запуск лише готує кеш і не вимірюється
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    run(env)
+
+    results = [run(env) for _ in range(RUNS)]
+    median = statistics.median(elapsed for elapsed, _, _ in results)
+    _, imports, modules = min(results, key=lambda result: result[0])
+    print(f"Start time: median {median:.0f} ms of {RUNS} runs (budget {budget:.0f} ms)")
+    print("Slowest imports (cumulative ms):")
+    for cumulative, depth, name in sorted(imports, reverse=True)[:12]:
+        print(f"  {cumulative:7.1f}  {'  ' * (depth - 1)}{name}")
+
+    eager = [name for name in LAZY_MODULES if name in modules]
+    if eager:
+        print(f"Imported at start, but should load on first use: {', '.join(eager)}")
+    if median > budget or eager:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
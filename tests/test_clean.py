@@ -0,0 +1,78 @@
+from assistant_ostap.assistant_ostap import clean
+
+
+def test_deduplicate_keeps_files_that_differ_after_partial_hash(tmp_path):
+    # Розмір між одним і двома шматками PARTIAL_HASH_SIZE, а відмінність
+    # після першого шматка
+    common = b"x" * 70_000
+    first = tmp_path / "a.bin"
+    second = tmp_path / "b.bin"
+    first.write_bytes(common + b"a" * 30_000)
+    second.write_bytes(common + b"b" * 30_000)
+
+    assert clean.find_duplicates([first, second]) == []
+    assert clean.deduplicate([first, second], hardlink=False) == []
+    assert second.exists()
+
+
+def test_deduplicate_removes_identical_copy(tmp_path):
+    first = tmp_path / "a.bin"
+    second = tmp_path / "a (1).bin"
+    first.write_bytes(b"y" * 100_000)
+    second.write_bytes(b"y" * 100_000)
+
+    assert clean.deduplicate([second, first], hardlink=False) == [second]
+    assert first.exists() and not second.exists()
+
+
+def test_failed_unpack_keeps_existing_folder(tmp_path):
+    archives = tmp_path / "archives"
+    (archives / "foo").mkdir(parents=True)
+    (archives / "foo" / "keep.txt").write_text("keep")
+    (archives / "foo.zip").write_bytes(b"not a zip")
+
+    clean.unpack_archive(tmp_path)
+    clean.unpack_archives([(archives / "foo.zip", archives / "foo")])
+
+    assert (archives / "foo" / "keep.txt").read_text() == "keep"
+
+
+def test_dry_run_leaves_folder_unchanged(tmp_path, monkeypatch):
+    (tmp_path / "photo.jpg").write_bytes(b"jpg")
+    answers = {"path": str(tmp_path), "dry_run": "y"}
+    monkeypatch.setattr(clean, "ask", lambda key, prompt: answers[key])
+
+    assert "photo.jpg" in clean.main()
+    assert sorted(item.name for item in tmp_path.iterdir()) == ["photo.jpg"]
+
+
+def test_invalid_config_is_reported_with_file_name(tmp_path, monkeypatch):
+    config = tmp_path / "clean.json"
+    config.write_text('{"magic": {"ebooks": ["zz"]}}')
+    monkeypatch.setenv("OSTAP_CLEAN_CONFIG", str(config))
+
+    assert clean.main().startswith(f"Invalid config {config}:")
+
+
+def test_second_run_after_empty_folder_in_category(tmp_path, monkeypatch):
+    (tmp_path / "a.png").write_bytes(b"png")
+    answers = {"path": str(tmp_path), "dry_run": "n", "dedup": "no"}
+    monkeypatch.setattr(clean, "ask", lambda key, prompt: answers[key])
+    assert clean.main() == "All ok"
+
+    (tmp_path / "images" / "empty2").mkdir()
+    (tmp_path / "new.png").write_bytes(b"new")
+    assert clean.main() == "All ok"
+
+    assert sorted(item.name for item in (tmp_path / "images").iterdir()) == ["a.png", "new.png"]
+    index = clean.FolderIndex.load(tmp_path)
+    assert "images/empty2" not in index.dirs
+    assert index.dirs["images"]["dirs"] == []
+
+
+def test_file_instead_of_folder(tmp_path, monkeypatch):
+    item = tmp_path / "notes.txt"
+    item.write_text("text")
+    monkeypatch.setattr(clean, "ask", lambda key, prompt: str(item))
+
+    assert clean.main() == f'Folder with path {item} doesn"t exist'
@@ -0,0 +1,12 @@
+import pytest
+
+from assistant_ostap.assistant_ostap import handlers
+from assistant_ostap.assistant_ostap.prompts import answering
+
+
+@pytest.mark.parametrize("command", ["import", "export"])
+def test_unsupported_file_format(tmp_path, command):
+    filename = str(tmp_path / "contacts.xyz")
+    with answering({"file": filename}):
+        assert handlers.commands[command]() == "Unsupported file format .xyz"
+    assert not (tmp_path / "contacts.xyz").exists()
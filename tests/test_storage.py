@@ -0,0 +1,202 @@
+import io
+import json
+
+import pytest
+
+from assistant_ostap.assistant_ostap.classes import (Address, AddressBook, Birthday,
+                                                     Email, Name, Phone, Record)
+from assistant_ostap.assistant_ostap.storage import (JournalBackend, JsonBackend,
+                                                     NoteBookJsonBackend, Session,
+                                                     SqliteBackend, SqliteDatabase,
+                                                     scan_json_object)
+
+
+def new_record(name):
+    return Record(Name(name), [])
+
+
+def full_record(name, phone="123456789012"):
+    return Record(Name(name), [Phone(phone)], Birthday("01.02.1990"),
+                  Address("Street, 5", "Київ", "Україна", "01001"), Email("a@b.cc"))
+
+
+def as_dict(book):
+    # add_phone перемішує телефони через множину, тож порядок не порівнюється
+    result = {name: record.to_dict() for name, record in book.data.items()}
+    for values in result.values():
+        values["phones"].sort()
+    return result
+
+
+def change_book(book):
+    # Усі операції, які пише журнал
+    book.add_record(full_record("Anna"))
+    book.add_record(full_record("Bob", "380501234567"))
+    book.add_record(full_record("Carl"))
+    book["Anna"].add_phone(Phone("+380671234567"))
+    book["Anna"].change_phone(Phone("123456789012"), Phone("123456789099"))
+    book["Bob"].delete_phone(Phone("380501234567"))
+    book["Bob"].change_birthday(Birthday("29.02.2000"))
+    book["Bob"].change_address(Address("Нова", "Львів", "Україна", "79000"))
+    book["Bob"].change_email(Email("bob@b.cc"))
+    del book["Carl"]
+
+
+def test_journal_round_trip(tmp_path):
+    filename = str(tmp_path / "data.json")
+    book = JournalBackend(filename).load()
+    change_book(book)
+
+    assert not (tmp_path / "data.json").exists()
+    loaded = as_dict(JournalBackend(filename).load())
+    assert loaded == as_dict(book)
+    assert sorted(loaded) == ["Anna", "Bob"]
+    assert loaded["Anna"]["phones"] == ["+380671234567", "123456789099"]
+    assert loaded["Bob"]["phones"] == []
+    assert loaded["Bob"]["birthday"] == "29.02.2000"
+    assert loaded["Bob"]["address"]["city"] == "Львів"
+    assert loaded["Bob"]["email"] == "bob@b.cc"
+
+
+def test_journal_drops_torn_last_line(tmp_path):
+    filename = str(tmp_path / "data.json")
+    book = JournalBackend(filename).load()
+    change_book(book)
+    expected = as_dict(book)
+    # Програма впала посеред запису рядка
+    with open(filename + ".journal", "a", encoding="utf-8") as file:
+        file.write('["put", "Dan", {"phones": ["1234')
+
+    backend = JournalBackend(filename)
+    book = backend.load()
+    assert as_dict(book) == expected
+    book.add_record(full_record("Eve"))
+    expected["Eve"] = book["Eve"].to_dict()
+    assert as_dict(JournalBackend(filename).load()) == expected
+
+
+def test_journal_compaction(tmp_path):
+    filename = str(tmp_path / "data.json")
+    backend = JournalBackend(filename, compact_every=5)
+    book = backend.load()
+    change_book(book)
+    book = backend.save(book)
+
+    assert (tmp_path / "data.json.journal").read_text() == ""
+    assert as_dict(JsonBackend(filename).load()) == as_dict(book)
+    book["Anna"].change_email(Email("anna@b.cc"))
+    assert len((tmp_path / "data.json.journal").read_text().splitlines()) == 1
+    assert as_dict(JournalBackend(filename).load()) == as_dict(book)
+
+
+def test_lazy_write_matches_write_to_file(tmp_path):
+    filename = str(tmp_path / "data.json")
+    book = AddressBook()
+    for name in ("Anna", "Богдан", "Carl", "Дмитро", "Eve"):
+        book.add_record(full_record(name))
+    book.write_to_file(filename)
+
+    def change(book):
+        book["Богдан"].add_phone(Phone("380501234567"))
+        book["Eve"].change_email(Email("eve@b.cc"))
+        del book["Carl"]
+        book.add_record(full_record("Юлія"))
+        del book["Anna"]
+        book.add_record(full_record("Anna", "380671234567"))
+
+    expected = AddressBook.open_file(filename)
+    change(expected)
+    expected.write_to_file(str(tmp_path / "expected.json"))
+    backend = JsonBackend(filename, lazy=True)
+    book = backend.load()
+    # Частина записів уже прочитана, решта ще ні
+    book["Anna"]
+    change(book)
+    backend.save(book)
+
+    assert (tmp_path / "data.json").read_bytes() == (tmp_path / "expected.json").read_bytes()
+    assert as_dict(book) == as_dict(expected)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 1 << 20])
+def test_scan_json_object_with_small_chunks(chunk_size):
+    data = {"Анна": {"phones": ["123456789012"], "city": "Київ"},
+            "Bob": [], "Ґ ґ \"}": "{\"}", "日本": 12.5}
+    content = json.dumps(data, indent=4, ensure_ascii=False).encode("utf-8")
+
+    values = {key: json.loads(content[offset:offset + length])
+              for key, offset, length in scan_json_object(io.BytesIO(content), chunk_size)}
+
+    assert values == data
+
+
+def test_sqlite_applies_every_change(tmp_path):
+    filename = str(tmp_path / "ostap.db")
+    expected = AddressBook()
+    change_book(expected)
+    backend = SqliteBackend(SqliteDatabase(filename))
+    book = backend.load()
+    change_book(book)
+    backend.save(book)
+
+    assert as_dict(SqliteBackend(SqliteDatabase(filename)).load()) == as_dict(expected)
+
+
+@pytest.mark.parametrize("backend", [
+    lambda filename: JsonBackend(filename),
+    lambda filename: JsonBackend(filename, lazy=True),
+    lambda filename: JournalBackend(filename, compact_every=1),
+    lambda filename: JournalBackend(filename),
+])
+def test_two_sessions_keep_both_changes(tmp_path, backend):
+    filename = str(tmp_path / "data.json")
+    first, second = Session(backend(filename)), Session(backend(filename))
+    # Обидва процеси прочитали книгу до того, як будь-хто її змінив
+    first_book, second_book = first.data, second.data
+    first_book.add_record(new_record("Anna"))
+    second_book.add_record(new_record("Bob"))
+
+    first.save()
+    second.save()
+    second.data["Bob"].add_phone(Phone("0501234567"))
+    second.save()
+    first.data.add_record(new_record("Carl"))
+    first.save()
+
+    book = Session(backend(filename)).data
+    assert sorted(book.data) == ["Anna", "Bob", "Carl"]
+    assert [phone.value for phone in book["Bob"].phones] == ["0501234567"]
+    assert sorted(first.data.data) == ["Anna", "Bob", "Carl"]
+
+
+def test_compaction_keeps_held_lines_of_other_session(tmp_path):
+    filename = str(tmp_path / "data.json")
+    first = Session(JournalBackend(filename, compact_every=2))
+    second = Session(JournalBackend(filename, compact_every=2))
+    first.data
+    with second.deferred():
+        # Рядки другої сесії чекають у пам'яті, а на виході з блоку
+        # журнал досягає compact_every і ущільнюється
+        for name in ("Xena", "Yan"):
+            second.data.add_record(new_record(name))
+            second.save()
+        for name in ("Anna", "Bob"):
+            first.data.add_record(new_record(name))
+            first.save()
+
+    book = Session(JournalBackend(filename)).data
+    assert sorted(book.data) == ["Anna", "Bob", "Xena", "Yan"]
+
+
+def test_two_sessions_add_notes_with_the_same_id(tmp_path):
+    filename = str(tmp_path / "notebook.json")
+    first = Session(NoteBookJsonBackend(filename))
+    second = Session(NoteBookJsonBackend(filename))
+    assert first.data.add_note("first") == second.data.add_note("second #tag")
+
+    first.save()
+    second.save()
+
+    notebook = Session(NoteBookJsonBackend(filename)).data
+    assert sorted(note.text for note in notebook.data.values()) == ["first", "second #tag"]
+    assert notebook.allocate_id() == "3"